@@ -1,3 +1,12 @@
-from .agent import root_agent
+from typing import Any
 
-__all__ = ["root_agent"] 
\ No newline at end of file
+__all__ = ["root_agent"]
+
+
+def __getattr__(name: str) -> Any:
+    # Build the agents on first access, so importing a submodule (cache, batch,
+    # session_store, ...) does not pay for the whole agent graph
+    if name == "root_agent":
+        from .agent import root_agent
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,24 @@
+import os
 import logging
 from google.adk.agents import LlmAgent, LoopAgent
 from google.adk.tools import google_search
 
-from .util import load_instruction_from_file
+from .formatting import TEMPLATES
+from .util import InstructionFile
+from .llm_cache import memoized_model_call, store_model_response
+from .ratelimit import pace_model_call
+from .tracing import trace_agent_end, trace_agent_start, trace_model_end, trace_model_error, trace_model_start
+from .session_summary import summary_callback
 from .tools import generate_multiple_images_tool, session_info_tool
+from .stages import (
+    CompletionChecker,
+    ContentFormatterStage,
+    ImageGenerationStage,
+    StreamingImageStage,
+    record_output_callback,
+    reuse_output_callback,
+)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -13,24 +26,38 @@ logger = logging.getLogger(__name__)
 scriptwriter_agent = LlmAgent(
     name="ScriptWriter",
     model="gemini-2.0-flash-001",
-    instruction=load_instruction_from_file("scriptwriter_instruction.txt"),
+    before_model_callback=[memoized_model_call, pace_model_call, trace_model_start],
+    after_model_callback=[store_model_response, trace_model_end],
+    on_model_error_callback=trace_model_error,
+    instruction=InstructionFile("scriptwriter_instruction.txt"),
     description="Creates engaging scripts for short-form content",
-    output_key="generated_script"
+    output_key="generated_script",
+    before_agent_callback=[reuse_output_callback("generated_script"), trace_agent_start],
+    after_agent_callback=[record_output_callback("generated_script"), summary_callback("generated_script"), trace_agent_end]
 )
 
 # Sub-agent 2: Image Prompt Generator
 image_prompt_agent = LlmAgent(
     name="ImagePromptGenerator",
     model="gemini-2.0-flash-001",
-    instruction=load_instruction_from_file("image_prompt_instruction.txt"),
+    before_model_callback=[memoized_model_call, pace_model_call, trace_model_start],
+    after_model_callback=[store_model_response, trace_model_end],
+    on_model_error_callback=trace_model_error,
+    instruction=InstructionFile("image_prompt_instruction.txt"),
     description="Converts scripts into detailed image prompts",
-    output_key="image_prompts"
+    output_key="image_prompts",
+    before_agent_callback=[reuse_output_callback("image_prompts"), trace_agent_start],
+    after_agent_callback=[record_output_callback("image_prompts"), summary_callback("image_prompts"), trace_agent_end]
 )
 
 # Sub-agent 3: Image Generator (using function tool)
+# LLM fallback used by image_generation_stage when the prompts cannot be parsed
 image_generator_agent = LlmAgent(
     name="ImageGenerator",
     model="gemini-2.0-flash-001",
+    before_model_callback=[pace_model_call, trace_model_start],
+    after_model_callback=trace_model_end,
+    on_model_error_callback=trace_model_error,
     instruction="""You are an image generation specialist. Your task is to generate images from the provided image prompts.
 
 When you receive image prompts from the session state, use the generate_multiple_images tool to create the images.
@@ -39,28 +66,64 @@ When you receive image prompts from the session state, use the generate_multiple
 1. Extract the image prompts from the session state (look for 'image_prompts' key)
 2. Parse the prompts if they're in JSON format with markdown code blocks
 3. Use the generate_multiple_images tool with the prompts
-4. Use the session_info tool to check the current state after generation
-5. Report the results back to the user
+4. Report the results back to the user, using the tool's response
+
+**Current session summary:**
+{session_summary_text?}
 
 **Available Tools:**
 - generate_multiple_images: Generate images from prompts
-- session_info: Check current session state and generated content
+- session_info: Full session summary, only needed if the summary above is not enough
 
 **Important:** Always use the generate_multiple_images tool when you have image prompts to process.
 
 **Example workflow:**
 - If you see image prompts in the session state, call generate_multiple_images with those prompts
-- Use session_info to verify what was generated
 - Report the results to the user""",
     description="Generates images from prompts using Imagen 3.0 via function tools",
     tools=[generate_multiple_images_tool, session_info_tool],
-    output_key="generated_images"
+    before_agent_callback=trace_agent_start,
+    after_agent_callback=trace_agent_end,
+    # The tool stores the image path list in 'generated_images'; keep the
+    # agent's text report under its own key so it does not overwrite it.
+    output_key="image_generation_report"
 )
 
-# Sub-agent 4: Formatter (Optional - combines script and image info)
+# Number of variants generated per image prompt (packed into as few Imagen calls as possible)
+IMAGE_VARIANTS = int(os.environ.get("IMAGE_VARIANTS", "1"))
+
+# Same bounds as the image request models, checked at startup rather than inside every run
+if not 1 <= IMAGE_VARIANTS <= 16:
+    raise ValueError(f"IMAGE_VARIANTS must be between 1 and 16, got {IMAGE_VARIANTS}")
+
+# Parses the prompts and calls the image tool directly, skipping a model round-trip
+image_generation_stage = ImageGenerationStage(
+    name="ImageGenerationStage",
+    description="Generates images from parsed prompts, falling back to the ImageGenerator agent",
+    fallback_agent=image_generator_agent,
+    variants=IMAGE_VARIANTS,
+    sub_agents=[image_generator_agent],
+    before_agent_callback=[reuse_output_callback("generated_images"), trace_agent_start],
+    after_agent_callback=[record_output_callback("generated_images"), trace_agent_end]
+)
+
+# Sub-agent 4: Formatter (combines script and image info)
+# Set CONTENT_FORMATTER to "markdown" (default) or "json" to render the summary
+# locally, or to "llm" to use the model-based formatter below.
+CONTENT_FORMATTER = os.environ.get("CONTENT_FORMATTER", "markdown")
+
+# Fail at startup rather than inside every run
+if CONTENT_FORMATTER != "llm" and CONTENT_FORMATTER not in TEMPLATES:
+    raise ValueError(
+        f"Unknown CONTENT_FORMATTER '{CONTENT_FORMATTER}'. Use 'llm' or one of: {', '.join(sorted(TEMPLATES))}"
+    )
+
 formatter_agent = LlmAgent(
     name="ContentFormatter",
     model="gemini-2.0-flash-001",
+    before_model_callback=[pace_model_call, trace_model_start],
+    after_model_callback=trace_model_end,
+    on_model_error_callback=trace_model_error,
     instruction="""Create a final summary combining the script from 'state['generated_script']' and the generated images from 'state['generated_images']'. 
     
     Format the output as:
@@ -78,14 +141,55 @@ formatter_agent = LlmAgent(
     - Images are saved locally and can be used for visual content
     - All files are organized in the output directory""",
     description="Formats the final content summary",
-    output_key="final_content_summary"
+    output_key="final_content_summary",
+    before_agent_callback=[reuse_output_callback("final_content_summary"), trace_agent_start],
+    after_agent_callback=[record_output_callback("final_content_summary"), summary_callback("final_content_summary"), trace_agent_end]
+)
+
+content_formatter_stage = ContentFormatterStage(
+    name="ContentFormatterStage",
+    description="Renders the final content summary from a local template",
+    template=CONTENT_FORMATTER if CONTENT_FORMATTER != "llm" else "markdown",
+    before_agent_callback=[reuse_output_callback("final_content_summary"), trace_agent_start],
+    after_agent_callback=[record_output_callback("final_content_summary"), trace_agent_end]
+)
+
+# Set STREAM_IMAGES=true to start rendering each image as soon as its prompt has
+# streamed out of the ImagePromptGenerator (requires StreamingMode.SSE in the
+# RunConfig for partial output). The LLM image fallback is not used in this mode.
+STREAM_IMAGES = os.environ.get("STREAM_IMAGES", "false").lower() in ("1", "true", "yes")
+
+if STREAM_IMAGES:
+    image_stages = [
+        StreamingImageStage(
+            name="StreamingImageStage",
+            description="Generates images while the image prompts are still being written",
+            prompt_agent=image_prompt_agent,
+            variants=IMAGE_VARIANTS,
+            sub_agents=[image_prompt_agent],
+            before_agent_callback=[reuse_output_callback("generated_images"), trace_agent_start],
+            after_agent_callback=[record_output_callback("generated_images"), trace_agent_end]
+        )
+    ]
+else:
+    image_stages = [image_prompt_agent, image_generation_stage]
+
+# Stops the loop as soon as the summary and images are valid
+completion_checker = CompletionChecker(
+    name="CompletionChecker",
+    description="Ends the workflow once the content summary and images are ready"
 )
 
 # Loop Agent Workflow
 content_creator_agent = LoopAgent(
     name="content_creator_agent",
-    max_iterations=3,  # Maximum 3 iterations to prevent infinite loops
-    sub_agents=[scriptwriter_agent, image_prompt_agent, image_generator_agent, formatter_agent],
+    max_iterations=3,  # Upper bound; CompletionChecker normally ends the loop after the first pass
+    sub_agents=[
+        scriptwriter_agent,
+        *image_stages,
+        formatter_agent if CONTENT_FORMATTER == "llm" else content_formatter_stage,
+        completion_checker,
+    ],
     description="Creates scripts, generates corresponding images, and provides a final summary"
 )
 
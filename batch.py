@@ -0,0 +1,246 @@
+"""
+Batch runner for the multi-agent content creator.
+
+Streams topics from a JSONL file, runs each one through root_agent in its own
+session with a configurable number of concurrent workers, and appends one JSON
+result per line to the output file. The output file doubles as the checkpoint:
+items already recorded there with status "ok" are skipped on the next run, so an
+interrupted batch resumes where it stopped. Failed items are retried on resume;
+readers should keep the last line for each id.
+
+Usage:
+    python -m simple_multi_agent.batch topics.jsonl --output results.jsonl --workers 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+from google.genai import types
+
+from .agent import root_agent
+from .session_store import SqliteSessionService, create_session_service
+from .stages import is_valid_output
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "simple_multi_agent_batch"
+BATCH_USER_ID = "batch"
+
+# Fields tried, in order, when the configured text field is missing
+_TEXT_FALLBACK_FIELDS = ("topic", "user_input", "prompt", "text")
+
+
+def _item_text(record: Dict[str, Any], text_field: str) -> str:
+    """Extracts the topic text from an input record."""
+    for field in (text_field, *_TEXT_FALLBACK_FIELDS):
+        value = record.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    # Records shaped like {"title": ..., "body": ...}
+    return "\n\n".join(str(record[field]) for field in ("title", "body") if record.get(field))
+
+
+def load_completed_ids(output_path: Path) -> Set[str]:
+    """Returns the ids of items already completed successfully in output_path."""
+    completed: Set[str] = set()
+    if not output_path.exists():
+        return completed
+
+    with open(output_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # Partially written line from an interrupted run
+            if result.get("status") == "ok":
+                completed.add(str(result.get("id")))
+    return completed
+
+
+def iter_pending_items(
+    input_path: Path,
+    completed: Set[str],
+    id_field: str,
+    text_field: str,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Stream (item_id, topic) pairs from a JSONL file, skipping completed items.
+
+    Args:
+        input_path: JSONL file with one topic record per line
+        completed: Ids to skip
+        id_field: Record field holding the item id (the line number is used if missing)
+        text_field: Record field holding the topic text
+
+    Yields:
+        Tuples of item id and topic text
+    """
+    with open(input_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping invalid JSON on line {line_number}")
+                continue
+            if isinstance(record, str):
+                record = {text_field: record}
+
+            item_id = str(record.get(id_field) or line_number)
+            if item_id in completed:
+                continue
+
+            text = _item_text(record, text_field)
+            if not text:
+                logger.warning(f"Skipping item {item_id}: no topic text")
+                continue
+            yield item_id, text
+
+
+async def run_item(runner: Runner, session_service: BaseSessionService, item_id: str, text: str) -> Dict[str, Any]:
+    """
+    Run a single topic through the workflow in a fresh session.
+
+    Args:
+        runner: Runner wrapping root_agent
+        session_service: Session service used by the runner
+        item_id: Id of the input item
+        text: Topic text sent as the user message
+
+    Returns:
+        Result record for the output file
+    """
+    started = time.perf_counter()
+    session_id = f"batch-{item_id}-{uuid.uuid4().hex[:8]}"
+    await session_service.create_session(
+        app_name=APP_NAME, user_id=BATCH_USER_ID, session_id=session_id, state={"user_input": text}
+    )
+
+    try:
+        content = types.Content(role="user", parts=[types.Part(text=text)])
+        with tracer.scope():
+            async for _ in runner.run_async(user_id=BATCH_USER_ID, session_id=session_id, new_message=content):
+                pass
+
+        session = await session_service.get_session(app_name=APP_NAME, user_id=BATCH_USER_ID, session_id=session_id)
+        state = session.state if session else {}
+        images = state.get("generated_images")
+        # A summary is written even when no images were generated, so require both
+        complete = all(is_valid_output(key, state.get(key)) for key in ("final_content_summary", "generated_images"))
+        return {
+            "id": item_id,
+            "status": "ok" if complete else "error",
+            "topic": text,
+            "generated_script": state.get("generated_script", ""),
+            "generated_images": images if isinstance(images, list) else [],
+            "final_content_summary": state.get("final_content_summary", ""),
+            "duration_seconds": round(time.perf_counter() - started, 3),
+        }
+    finally:
+        # Finished sessions are not needed again; keep memory flat across the batch
+        await session_service.delete_session(app_name=APP_NAME, user_id=BATCH_USER_ID, session_id=session_id)
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    workers: int = 4,
+    id_field: str = "request_id",
+    text_field: str = "topic",
+    session_service: Optional[BaseSessionService] = None,
+) -> Dict[str, int]:
+    """
+    Process every pending item of input_path with a pool of concurrent workers.
+
+    Args:
+        input_path: JSONL file of topics
+        output_path: JSONL file results are appended to (also the resume checkpoint)
+        workers: Number of sessions run concurrently
+        id_field: Record field holding the item id
+        text_field: Record field holding the topic text
+        session_service: Session service to use (defaults to create_session_service())
+
+    Returns:
+        Counts of succeeded, failed and previously completed items
+    """
+    output_file = Path(output_path)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    completed = load_completed_ids(output_file)
+    counts = {"ok": 0, "error": 0, "skipped": len(completed)}
+    if completed:
+        logger.info(f"Resuming batch: {len(completed)} items already completed")
+
+    owns_session_service = session_service is None
+    session_service = session_service or create_session_service()
+    runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
+
+    # Bounded queue so the input file is streamed rather than loaded up front
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    write_lock = asyncio.Lock()
+
+    with open(output_file, "a", encoding="utf-8") as out:
+        async def worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                item_id, text = item
+                logger.info(f"Processing item {item_id}")
+                try:
+                    result = await run_item(runner, session_service, item_id, text)
+                except Exception as e:
+                    logger.error(f"Error processing item {item_id}: {e}", exc_info=True)
+                    result = {"id": item_id, "status": "error", "topic": text, "error": str(e)}
+
+                async with write_lock:
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+                counts[result["status"]] += 1
+
+        tasks = [asyncio.create_task(worker()) for _ in range(max(1, workers))]
+        for item in iter_pending_items(Path(input_path), completed, id_field, text_field):
+            await queue.put(item)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+
+    if owns_session_service and isinstance(session_service, SqliteSessionService):
+        await session_service.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the content creator over a JSONL file of topics")
+    parser.add_argument("input", help="JSONL file with one topic per line")
+    parser.add_argument("--output", "-o", default="output/batch_results.jsonl", help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Number of topics processed concurrently")
+    parser.add_argument("--id-field", default="request_id", help="Record field holding the item id")
+    parser.add_argument("--text-field", default="topic", help="Record field holding the topic text")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    started = time.perf_counter()
+    counts = asyncio.run(run_batch(args.input, args.output, args.workers, args.id_field, args.text_field))
+    elapsed = time.perf_counter() - started
+    print(
+        f"Batch finished in {elapsed:.1f}s: {counts['ok']} succeeded, "
+        f"{counts['error']} failed, {counts['skipped']} already completed. Results: {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Offline benchmark suite for the multi-agent content creator.
+
+Replaces Imagen and Gemini with local stand-ins that have configurable latency,
+failure rate and image size, so performance can be measured without network
+access or an API key. Scenarios:
+
+- tool: generate_multiple_images called directly
+- workflow: the full root_agent workflow through Runner, one session at a time
+- load: many root_agent sessions running concurrently
+- coldstart: import time of the package and agent graph in fresh interpreters
+
+Results (p50/p95/p99 latency, throughput, errors and peak RSS) are written as JSON.
+
+Usage:
+    python -m simple_multi_agent.benchmark --scenario all --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types as pytypes
+from typing import Any, AsyncGenerator, Callable, Dict, List
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import errors, types
+
+from . import agent
+from .cache import image_cache
+from .dedup import prompt_deduplicator
+from .ratelimit import gemini_limiter, imagen_limiter
+from .tools import GenerateMultipleImagesRequest, generate_multiple_images
+from .tracing import tracer
+from .util import register_client
+
+APP_NAME = "simple_multi_agent_benchmark"
+
+FAKE_PROMPTS = [
+    "A dramatic close-up of a scientist in a modern laboratory, cinematic lighting, photorealistic style",
+    "A futuristic cityscape with flying cars and neon lights, viewed from above, high detail",
+    "A quiet classroom where students work alongside friendly robots, warm morning light",
+    "A sunrise over a solar farm stretching to the horizon, clean and modern aesthetic",
+]
+
+
+class _FakeModels:
+    """Stand-in for client.models / client.aio.models with Imagen-like behaviour."""
+
+    def __init__(self, backend: "FakeGenaiClient", is_async: bool):
+        self._backend = backend
+        self._is_async = is_async
+
+    def _response(self, config: Any) -> Any:
+        if random.random() < self._backend.failure_rate:
+            raise errors.ServerError(503, {"error": {"code": 503, "message": "Simulated failure", "status": "UNAVAILABLE"}})
+        count = (config or {}).get("number_of_images", 1) if isinstance(config, dict) else getattr(config, "number_of_images", 1) or 1
+        images = [
+            pytypes.SimpleNamespace(image=pytypes.SimpleNamespace(image_bytes=b"\xff\xd8\xff\xe0" + os.urandom(self._backend.image_bytes)))
+            for _ in range(count)
+        ]
+        return pytypes.SimpleNamespace(generated_images=images)
+
+    def _latency(self) -> float:
+        return max(0.0, random.gauss(self._backend.latency_seconds, self._backend.latency_seconds * 0.1))
+
+    def generate_images(self, model: str, prompt: str, config: Any = None) -> Any:
+        if self._is_async:
+            return self._generate_images_async(config)
+        time.sleep(self._latency())
+        return self._response(config)
+
+    async def _generate_images_async(self, config: Any) -> Any:
+        await asyncio.sleep(self._latency())
+        return self._response(config)
+
+
+class FakeGenaiClient:
+    """
+    Local stand-in for genai.Client covering the calls the tools make.
+
+    Args:
+        latency_seconds: Mean latency of each generate_images call
+        failure_rate: Probability (0-1) that a call raises a 503 error
+        image_bytes: Size of each returned image payload
+    """
+
+    def __init__(self, latency_seconds: float = 0.5, failure_rate: float = 0.0, image_bytes: int = 200_000):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.image_bytes = image_bytes
+        self.models = _FakeModels(self, is_async=False)
+        self.aio = pytypes.SimpleNamespace(models=_FakeModels(self, is_async=True), aclose=self._aclose)
+
+    async def _aclose(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class FakeGemini(BaseLlm):
+    """Local stand-in for Gemini that answers each agent with canned output after a fixed latency."""
+
+    latency_seconds: float = 0.5
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"fake-.*"]
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        await asyncio.sleep(self.latency_seconds)
+        instruction = str(llm_request.config.system_instruction if llm_request.config else "")
+        if "Script Writer" in instruction:
+            text = "Imagine a world where machines learn alongside us. " * 8
+        elif "image_prompts" in instruction:
+            text = "```json\n" + json.dumps({"image_prompts": FAKE_PROMPTS}, indent=2) + "\n```"
+        else:
+            text = "# Generated Content Summary\n\nDone."
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=len(instruction) // 4, candidates_token_count=len(text) // 4),
+        )
+
+
+def install_fakes(latency_seconds: float, llm_latency_seconds: float, failure_rate: float, image_bytes: int) -> None:
+    """Points the shared client registry and every LLM agent at the local stand-ins."""
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark-offline-key")
+    register_client(FakeGenaiClient(latency_seconds, failure_rate, image_bytes))
+
+    # Measure the pipeline itself: no cache hits, no prompt collapsing and no quota pacing
+    image_cache.enabled = False
+    prompt_deduplicator.enabled = False
+    imagen_limiter.configure(rate_per_second=1_000_000, burst=1_000_000, concurrency=1024)
+    gemini_limiter.configure(rate_per_second=1_000_000, burst=1_000_000, concurrency=1024)
+
+    fake_llm = FakeGemini(model="fake-gemini", latency_seconds=llm_latency_seconds)
+    for llm_agent in (agent.scriptwriter_agent, agent.image_prompt_agent, agent.image_generator_agent, agent.formatter_agent):
+        llm_agent.model = fake_llm
+
+
+def summarize(latencies: List[float], errors_count: int, elapsed: float) -> Dict[str, Any]:
+    """Computes latency percentiles and throughput for one scenario."""
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        if not ordered:
+            return 0.0
+        # Nearest-rank percentile
+        index = min(len(ordered) - 1, max(0, math.ceil(p * len(ordered) / 100) - 1))
+        return round(ordered[index], 4)
+
+    return {
+        "count": len(ordered),
+        "errors": errors_count,
+        "p50_seconds": percentile(50),
+        "p95_seconds": percentile(95),
+        "p99_seconds": percentile(99),
+        "mean_seconds": round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+        "throughput_per_second": round(len(ordered) / elapsed, 3) if elapsed > 0 else 0.0,
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def bench_tool(iterations: int, prompts_per_call: int) -> Dict[str, Any]:
+    """Times generate_multiple_images called directly."""
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    for iteration in range(iterations):
+        request = GenerateMultipleImagesRequest(
+            prompts=[f"{FAKE_PROMPTS[i % len(FAKE_PROMPTS)]} #{iteration}-{i}" for i in range(prompts_per_call)],
+            output_prefix=f"bench_{iteration}"
+        )
+        call_started = time.perf_counter()
+        response = generate_multiple_images(request, None)
+        latencies.append(time.perf_counter() - call_started)
+        failures += 0 if response.success and len(response.image_paths) == prompts_per_call else 1
+    return summarize(latencies, failures, time.perf_counter() - started)
+
+
+async def _run_session(runner: Runner, session_service: InMemorySessionService, index: int) -> float:
+    session_id = f"bench-{index}"
+    await session_service.create_session(app_name=APP_NAME, user_id="bench", session_id=session_id)
+    content = types.Content(role="user", parts=[types.Part(text=f"Create a script about topic {index}")])
+    started = time.perf_counter()
+    with tracer.scope():
+        async for _ in runner.run_async(user_id="bench", session_id=session_id, new_message=content):
+            pass
+    latency = time.perf_counter() - started
+
+    session = await session_service.get_session(app_name=APP_NAME, user_id="bench", session_id=session_id)
+    await session_service.delete_session(app_name=APP_NAME, user_id="bench", session_id=session_id)
+    if not session or not session.state.get("final_content_summary"):
+        raise RuntimeError(f"Session {index} produced no summary")
+    return latency
+
+
+async def bench_sessions(total: int, concurrency: int) -> Dict[str, Any]:
+    """Runs root_agent sessions through Runner with the given concurrency."""
+    session_service = InMemorySessionService()
+    runner = Runner(app_name=APP_NAME, agent=agent.root_agent, session_service=session_service)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(index: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            try:
+                latencies.append(await _run_session(runner, session_service, index))
+            except Exception:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    return summarize(latencies, failures, time.perf_counter() - started)
+
+
+# Child-process script timing a cold import of the package and the agent graph
+_COLDSTART_SCRIPT = """
+import importlib, json, sys, time
+started = time.perf_counter()
+package = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+package.root_agent
+print(json.dumps({"import": imported - started, "root_agent": time.perf_counter() - imported}))
+"""
+
+
+def bench_coldstart(iterations: int, top: int = 10) -> Dict[str, Any]:
+    """
+    Times cold imports of the package in fresh interpreters.
+
+    Args:
+        iterations: Number of fresh interpreters to start
+        top: Number of slowest modules to report from python -X importtime
+
+    Returns:
+        Latency summary of import plus agent construction, the mean of each
+        phase, and the modules with the largest cumulative import time
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")]))}
+    command = [sys.executable, "-c", _COLDSTART_SCRIPT, __package__]
+
+    latencies, phases, failures = [], {"import": [], "root_agent": []}, 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            failures += 1
+            continue
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        latencies.append(timings["import"] + timings["root_agent"])
+        for phase, seconds in timings.items():
+            phases[phase].append(seconds)
+    summary = summarize(latencies, failures, time.perf_counter() - started)
+    summary["mean_phase_seconds"] = {phase: round(sum(values) / len(values), 4) if values else 0.0 for phase, values in phases.items()}
+
+    # "import time: self [us] | cumulative | imported package" lines on stderr
+    profile = subprocess.run([sys.executable, "-X", "importtime", *command[1:]], env=env, capture_output=True, text=True)
+    modules = []
+    for line in profile.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            modules.append((int(fields[1]), fields[2].strip()))
+    summary["slowest_imports"] = [
+        {"module": module, "cumulative_seconds": round(micros / 1e6, 4)}
+        for micros, module in sorted(modules, reverse=True)[:top]
+    ]
+    return summary
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 2)
+
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], Dict[str, Any]]] = {
+    "tool": lambda args: bench_tool(args.iterations, args.prompts),
+    "workflow": lambda args: asyncio.run(bench_sessions(args.iterations, 1)),
+    "load": lambda args: asyncio.run(bench_sessions(args.sessions, args.concurrency)),
+    "coldstart": lambda args: bench_coldstart(args.iterations),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmarks with local Imagen/Gemini stand-ins")
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--iterations", type=int, default=10, help="Runs for the tool, workflow and coldstart scenarios")
+    parser.add_argument("--prompts", type=int, default=4, help="Prompts per generate_multiple_images call")
+    parser.add_argument("--sessions", type=int, default=50, help="Total sessions in the load scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent sessions in the load scenario")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean Imagen latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Gemini latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of a simulated Imagen failure")
+    parser.add_argument("--image-bytes", type=int, default=200_000, help="Size of each fake image")
+    parser.add_argument("--output", "-o", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    install_fakes(args.latency, args.llm_latency, args.failure_rate, args.image_bytes)
+
+    # Keep generated files out of the working tree
+    output_path = os.path.abspath(args.output) if args.output else None
+    os.chdir(tempfile.mkdtemp(prefix="simple_multi_agent_bench_"))
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "scenarios": {name: SCENARIOS[name](args) for name in names},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
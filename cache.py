@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCache:
+    """
+    On-disk, content-addressed cache for generated images.
+
+    Entries are keyed on a hash of the model, prompt and generation config, so an
+    identical request is served from disk instead of calling Imagen again. Each
+    entry is a single file named after its key; its modification time doubles as
+    the last-access time, which drives LRU eviction by total size and by age.
+    """
+
+    # Minimum seconds between eviction sweeps triggered by put()
+    EVICT_INTERVAL_SECONDS = 30.0
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_age_seconds: float, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(model: str, prompt: str, config: Dict[str, Any]) -> str:
+        """Builds the content address for a generation request."""
+        payload = json.dumps({"model": model, "prompt": prompt, "config": config}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached image.
+
+        Args:
+            key: Content address returned by make_key
+
+        Returns:
+            Path to the stored image bytes, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                self._stats["misses"] += 1
+                return None
+
+            if time.time() - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                self._stats["misses"] += 1
+                self._stats["evictions"] += 1
+                return None
+
+            # Refresh the access time used for LRU ordering
+            os.utime(path)
+            self._stats["hits"] += 1
+            return str(path)
+
+    def put(self, key: str, image_bytes: bytes) -> Optional[str]:
+        """
+        Store image bytes under the given key and evict entries over budget.
+
+        Args:
+            key: Content address returned by make_key
+            image_bytes: Raw image bytes as returned by the API
+
+        Returns:
+            Path to the stored entry, or None if caching is disabled or failed
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(image_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write image cache entry {key[:12]}: {e}")
+            return None
+
+        with self._lock:
+            self._stats["stores"] += 1
+            sweep_due = time.time() - self._last_evict >= self.EVICT_INTERVAL_SECONDS
+        if sweep_due:
+            self.evict()
+        return str(path)
+
+    def copy_to(self, key: str, destination: str) -> bool:
+        """Copies a cached entry to destination. Returns False on a miss."""
+        cached_path = self.get(key)
+        if not cached_path:
+            return False
+        try:
+            shutil.copyfile(cached_path, destination)
+        except OSError as e:
+            logger.warning(f"Could not copy cached image {key[:12]}: {e}")
+            return False
+        return True
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then least recently used ones until under max_bytes.
+
+        Returns:
+            Number of entries removed
+        """
+        if not self.cache_dir.exists():
+            return 0
+
+        with self._lock:
+            now = time.time()
+            self._last_evict = now
+            entries = []
+            removed = 0
+            for path in self.cache_dir.glob("*/*.bin"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    path.unlink(missing_ok=True)
+                    removed += 1
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+            self._stats["evictions"] += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the hit ratio."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# Shared cache used by the image generation tools
+image_cache = ImageCache(
+    cache_dir=os.environ.get("IMAGE_CACHE_DIR", "output/cache/images"),
+    max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))),
+    max_age_seconds=float(os.environ.get("IMAGE_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600))),
+    enabled=os.environ.get("IMAGE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no"),
+)
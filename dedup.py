@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime modulus for the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+
+def normalize(prompt: str) -> str:
+    """Lowercases a prompt and strips punctuation and repeated whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Returns the word n-grams of normalized text (the whole text when it is shorter than size)."""
+    words = text.split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class PromptDeduplicator:
+    """
+    Collapses near-identical image prompts before they are sent to Imagen.
+
+    Prompts are normalized, split into word shingles and summarized by a MinHash
+    signature; two prompts whose estimated Jaccard similarity reaches threshold
+    are treated as the same image. Within a request, later duplicates share the
+    images of the first occurrence. Across requests, a bounded history of
+    recently rendered prompts lets a near-identical prompt reuse earlier images.
+
+    Prompts are only compared within the same scope (e.g. session, aspect ratio
+    and variant count), so images are never shared between sessions or
+    different settings.
+
+    A single changed word only removes a few shingles, so long prompts that
+    differ in a key detail ("red" vs "blue") can still score around 0.9. The
+    default threshold of 1.0 therefore only collapses prompts that are
+    identical after normalization; lower it to also merge rewordings.
+    """
+
+    def __init__(self, threshold: float = 1.0, num_perm: int = 128, history_size: int = 256, enabled: bool = True):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.history_size = history_size
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._history: "OrderedDict[Tuple[Hashable, Tuple[int, ...]], List[str]]" = OrderedDict()
+        self._stats = {"prompts": 0, "collapsed": 0, "history_hits": 0}
+
+        # Deterministic (a, b) pairs for the universal hash permutations
+        self._permutations = []
+        for i in range(num_perm):
+            digest = hashlib.sha256(f"minhash-{i}".encode("utf-8")).digest()
+            self._permutations.append((int.from_bytes(digest[:8], "big") % (_PRIME - 1) + 1, int.from_bytes(digest[8:16], "big") % _PRIME))
+
+    def signature(self, prompt: str) -> Tuple[int, ...]:
+        """Returns the MinHash signature of a prompt."""
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in set(shingles(normalize(prompt)))
+        ]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations)
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Estimates the Jaccard similarity of two prompts from their signatures."""
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first) if first else 0.0
+
+    def collapse(self, prompts: List[str], scopes: Optional[List[Hashable]] = None) -> List[int]:
+        """
+        Map each prompt to the first earlier prompt it duplicates.
+
+        Args:
+            prompts: Prompts of one request, in order
+            scopes: Optional scope per prompt; only prompts with equal scopes are compared
+
+        Returns:
+            For each prompt, the index of the prompt whose images it should use
+            (its own index when it is unique)
+        """
+        canonical = list(range(len(prompts)))
+        if not self.enabled:
+            return canonical
+
+        signatures = [self.signature(prompt) for prompt in prompts]
+        for i in range(len(prompts)):
+            for j in range(i):
+                if canonical[j] != j or (scopes and scopes[i] != scopes[j]):
+                    continue
+                if self.similarity(signatures[i], signatures[j]) >= self.threshold:
+                    canonical[i] = j
+                    break
+
+        collapsed = sum(1 for i, j in enumerate(canonical) if i != j)
+        with self._lock:
+            self._stats["prompts"] += len(prompts)
+            self._stats["collapsed"] += collapsed
+        if collapsed:
+            logger.info(f"Collapsed {collapsed} near-duplicate prompts out of {len(prompts)}")
+        return canonical
+
+    def reuse(self, prompt: str, scope: Hashable, destinations: List[str]) -> bool:
+        """
+        Copy the images of a near-identical, recently rendered prompt to destinations.
+
+        Args:
+            prompt: Prompt about to be rendered
+            scope: Scope the prompt is rendered in
+            destinations: Paths the prompt's images would be written to
+
+        Returns:
+            True if every destination was filled from history
+        """
+        if not self.enabled:
+            return False
+        signature = self.signature(prompt)
+        with self._lock:
+            candidates = [
+                (key, paths) for key, paths in reversed(self._history.items())
+                if key[0] == scope and len(paths) == len(destinations)
+            ]
+        for key, paths in candidates:
+            if self.similarity(signature, key[1]) < self.threshold or not all(os.path.exists(path) for path in paths):
+                continue
+            try:
+                for source, destination in zip(paths, destinations):
+                    if os.path.abspath(source) != os.path.abspath(destination):
+                        shutil.copyfile(source, destination)
+            except OSError as e:
+                logger.warning(f"Could not reuse images of a similar prompt: {e}")
+                return False
+            with self._lock:
+                self._history.move_to_end(key)
+                self._stats["history_hits"] += 1
+            logger.info(f"Reusing images of a near-identical earlier prompt for '{prompt[:50]}...'")
+            return True
+        return False
+
+    def remember(self, prompt: str, scope: Hashable, paths: List[str]) -> None:
+        """Adds a rendered prompt and its image paths to the history."""
+        if not self.enabled or not paths:
+            return
+        key = (scope, self.signature(prompt))
+        with self._lock:
+            self._history[key] = list(paths)
+            self._history.move_to_end(key)
+            while len(self._history) > self.history_size:
+                self._history.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of prompts seen, collapsed within requests and served from history."""
+        with self._lock:
+            return dict(self._stats)
+
+
+# Shared deduplicator used by the image generation tools
+prompt_deduplicator = PromptDeduplicator(
+    threshold=float(os.environ.get("PROMPT_DEDUP_THRESHOLD", "1.0")),
+    history_size=int(os.environ.get("PROMPT_DEDUP_HISTORY", "256")),
+    enabled=os.environ.get("PROMPT_DEDUP_ENABLED", "true").lower() not in ("0", "false", "no"),
+)
@@ -0,0 +1,201 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .storage import output_store
+from .util import write_bytes_atomic
+
+logger = logging.getLogger(__name__)
+
+# File extension and Pillow format for each supported derivative format
+FORMATS = {
+    "jpeg": ("jpg", "JPEG"),
+    "png": ("png", "PNG"),
+    "webp": ("webp", "WEBP"),
+    "avif": ("avif", "AVIF"),
+}
+
+
+class DerivativeSpec(BaseModel):
+    """One derivative produced for every generated image."""
+    name: str = Field(description="Name of the derivative, used in file names and state")
+    max_size: int = Field(default=0, ge=0, description="Longest side in pixels (0 keeps the original size)")
+    format: str = Field(default="webp", description="Output format: jpeg, png, webp or avif")
+    quality: int = Field(default=80, ge=1, le=100, description="Encoder quality")
+
+
+def parse_specs(value: str) -> List[DerivativeSpec]:
+    """
+    Parse derivative specs from a comma-separated "name:max_size:format:quality" list.
+
+    Args:
+        value: e.g. "thumb:256:webp:75,web:1024:avif:60" (trailing fields may be omitted)
+
+    Returns:
+        The parsed specs
+    """
+    specs = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        fields = item.split(":")
+        spec = DerivativeSpec(
+            name=fields[0],
+            max_size=int(fields[1]) if len(fields) > 1 and fields[1] else 0,
+            format=(fields[2] if len(fields) > 2 and fields[2] else "webp").lower().replace("jpg", "jpeg"),
+            quality=int(fields[3]) if len(fields) > 3 and fields[3] else 80,
+        )
+        if spec.format not in FORMATS:
+            raise ValueError(f"Unsupported derivative format '{spec.format}' in '{item}'")
+        specs.append(spec)
+    return specs
+
+
+def derivative_path(image_path: str, spec: DerivativeSpec) -> str:
+    """Returns where the spec's derivative of image_path is written: <dir>/derivatives/<stem>_<name>.<ext>."""
+    path = Path(image_path)
+    return str(path.parent / "derivatives" / f"{path.stem}_{spec.name}.{FORMATS[spec.format][0]}")
+
+
+def render_derivatives(image_path: str, specs: List[Dict[str, Any]]) -> List[str]:
+    """
+    Write every derivative of one image (runs in a worker process).
+
+    Args:
+        image_path: Source image
+        specs: DerivativeSpec dicts
+
+    Returns:
+        Paths of the derivatives that were written
+    """
+    from PIL import Image
+
+    written = []
+    with Image.open(image_path) as source:
+        source.load()
+        for spec in (DerivativeSpec(**spec) for spec in specs):
+            image = source.copy()
+            if spec.max_size:
+                image.thumbnail((spec.max_size, spec.max_size))
+            if spec.format == "jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            buffer = BytesIO()
+            image.save(buffer, format=FORMATS[spec.format][1], quality=spec.quality)
+            output_path = derivative_path(image_path, spec)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            write_bytes_atomic(buffer.getvalue(), output_path)
+            written.append(output_path)
+    return written
+
+
+class DerivativePipeline:
+    """
+    Produces thumbnails and re-encoded versions of generated images in a process pool.
+
+    submit() returns the planned derivative paths immediately and renders them in
+    the background, so image generation never waits for Pillow. The paths are
+    deterministic, which lets callers record them in session state right away;
+    a file appears once its worker finishes. Finished derivatives are added to
+    the run's output manifest.
+    """
+
+    def __init__(self, specs: List[DerivativeSpec], max_workers: int):
+        self.specs = specs
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: List[Future] = []
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.specs)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs threads and an event loop is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _on_done(self, image_path: str, future: Future) -> None:
+        with self._lock:
+            self._pending.remove(future)
+        try:
+            paths = future.result()
+        except Exception as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.warning(f"Could not create derivatives of '{image_path}': {e}")
+            return
+        with self._lock:
+            self._stats["completed"] += 1
+        output_store.record(Path(image_path).parent, paths, kind="derivative", source=image_path)
+
+    def submit(self, image_paths: List[str]) -> List[Dict[str, str]]:
+        """
+        Schedule derivatives of each image.
+
+        Args:
+            image_paths: Generated images to post-process
+
+        Returns:
+            For each image, the planned derivative path by derivative name
+        """
+        if not self.enabled:
+            return [{} for _ in image_paths]
+
+        executor = self._get_executor()
+        specs = [spec.model_dump() for spec in self.specs]
+        planned = []
+        for image_path in image_paths:
+            future = executor.submit(render_derivatives, os.path.abspath(image_path), specs)
+            with self._lock:
+                self._pending.append(future)
+                self._stats["submitted"] += 1
+            future.add_done_callback(lambda done, path=image_path: self._on_done(path, done))
+            planned.append({spec.name: derivative_path(image_path, spec) for spec in self.specs})
+        return planned
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Blocks until every submitted derivative has been written or failed."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns submitted, completed and failed counts, and the number still pending."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    def shutdown(self) -> None:
+        """Finishes pending derivatives and stops the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+# Shared pipeline used by the image generation tools and stages
+derivative_pipeline = DerivativePipeline(
+    specs=parse_specs(os.environ.get("IMAGE_DERIVATIVES", "")),
+    max_workers=int(os.environ.get("IMAGE_DERIVATIVE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))),
+)
+
+atexit.register(derivative_pipeline.shutdown)
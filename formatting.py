@@ -0,0 +1,61 @@
+import json
+import logging
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# A template renders the final content summary from the script and image paths
+ContentTemplate = Callable[[str, List[str]], str]
+
+TEMPLATES: Dict[str, ContentTemplate] = {}
+
+
+def register_template(name: str) -> Callable[[ContentTemplate], ContentTemplate]:
+    """Registers a content summary template under the given name."""
+    def decorator(template: ContentTemplate) -> ContentTemplate:
+        TEMPLATES[name] = template
+        return template
+    return decorator
+
+
+@register_template("markdown")
+def render_markdown(script: str, image_paths: List[str]) -> str:
+    """Renders the summary in the markdown layout previously produced by the ContentFormatter agent."""
+    images = "\n".join(f"- {path}" for path in image_paths) if image_paths else "- No images were generated"
+    return (
+        "# Generated Content Summary\n"
+        "\n"
+        "## Script\n"
+        f"{script.strip()}\n"
+        "\n"
+        "## Generated Images\n"
+        f"{images}\n"
+        "\n"
+        "## Usage Instructions\n"
+        "- The script can be used for voiceover or text content\n"
+        "- Images are saved locally and can be used for visual content\n"
+        "- All files are organized in the output directory\n"
+    )
+
+
+@register_template("json")
+def render_json(script: str, image_paths: List[str]) -> str:
+    """Renders the summary as a JSON document."""
+    return json.dumps({"script": script.strip(), "images": list(image_paths)}, indent=2)
+
+
+def render_content_summary(script: str, image_paths: List[str], template: str = "markdown") -> str:
+    """
+    Render the final content summary without a model call.
+
+    Args:
+        script: The generated script
+        image_paths: Paths of the generated images
+        template: Name of a registered template
+
+    Returns:
+        The rendered summary
+    """
+    if template not in TEMPLATES:
+        raise ValueError(f"Unknown content template '{template}'. Available: {', '.join(sorted(TEMPLATES))}")
+    return TEMPLATES[template](script, image_paths)
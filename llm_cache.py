@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from google.adk.models import LlmRequest, LlmResponse
+
+logger = logging.getLogger(__name__)
+
+# Session state flag that skips the cache for a request (read and write)
+BYPASS_STATE_KEY = "bypass_llm_cache"
+
+
+class LlmResponseCache:
+    """
+    Persistent memoization of model responses, backed by SQLite.
+
+    Entries are keyed on the model, a hash of the system instruction and the
+    request contents, so an identical request from any session or batch run is
+    answered from disk. Entries expire after ttl_seconds, and the least recently
+    used ones are evicted once more than max_entries are stored.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int, enabled: bool = True):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS llm_responses_accessed ON llm_responses (accessed_at)")
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def make_key(llm_request: LlmRequest) -> str:
+        """Builds the cache key for a model request."""
+        config = llm_request.config
+        instruction = config.system_instruction if config else None
+        if instruction is not None and not isinstance(instruction, str):
+            instruction = json.dumps(instruction.model_dump(mode="json", exclude_none=True), sort_keys=True)
+        payload = json.dumps(
+            {
+                "model": llm_request.model,
+                "instruction": hashlib.sha256((instruction or "").encode("utf-8")).hexdigest(),
+                "contents": [content.model_dump(mode="json", exclude_none=True) for content in llm_request.contents],
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[LlmResponse]:
+        """Returns the cached response for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            try:
+                connection = self._connect()
+                row = connection.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        connection.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                        connection.commit()
+                        self._stats["evictions"] += 1
+                    self._stats["misses"] += 1
+                    return None
+                connection.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+                connection.commit()
+            except sqlite3.Error:
+                # Counted as a miss; the caller decides whether to log or raise
+                self._stats["misses"] += 1
+                raise
+            self._stats["hits"] += 1
+        return LlmResponse.model_validate_json(row[0])
+
+    def put(self, key: str, llm_response: LlmResponse) -> None:
+        """Stores a response and evicts the least recently used entries over max_entries."""
+        now = time.time()
+        data = llm_response.model_dump_json(exclude_none=True)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, now, now),
+            )
+            evicted = connection.execute(
+                "DELETE FROM llm_responses WHERE created_at < ? OR key IN ("
+                "SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl_seconds, self.max_entries),
+            ).rowcount
+            connection.commit()
+            self._stats["stores"] += 1
+            self._stats["evictions"] += max(0, evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the hit ratio."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+llm_cache = LlmResponseCache(
+    db_path=os.environ.get("LLM_CACHE_PATH", "output/cache/llm_responses.sqlite3"),
+    ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000")),
+    enabled=os.environ.get("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+)
+
+# Per-agent state key holding the cache key of the agent's in-flight model call.
+# temp: state lives only for the invocation, so abandoned calls leave nothing behind.
+PENDING_KEY_PREFIX = "temp:llm_cache_key:"
+
+
+async def memoized_model_call(callback_context: Any, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback that answers a request from llm_cache when possible."""
+    if not llm_cache.enabled or callback_context.state.get(BYPASS_STATE_KEY):
+        return None
+
+    pending_key = PENDING_KEY_PREFIX + callback_context.agent_name
+    key = llm_cache.make_key(llm_request)
+    try:
+        # SQLite calls block, so keep them off the event loop
+        cached = await asyncio.to_thread(llm_cache.get, key)
+    except sqlite3.Error as e:
+        logger.warning(f"Could not read model response from cache: {e}")
+        cached = None
+    if cached is not None:
+        logger.info(f"{callback_context.agent_name}: serving model response from cache")
+        callback_context.state[pending_key] = None
+        return cached
+
+    callback_context.state[pending_key] = key
+    return None
+
+
+async def store_model_response(callback_context: Any, llm_response: LlmResponse) -> None:
+    """after_model_callback that stores complete, successful responses in llm_cache."""
+    if not llm_cache.enabled or llm_response.partial:
+        return None
+
+    pending_key = PENDING_KEY_PREFIX + callback_context.agent_name
+    key = callback_context.state.get(pending_key)
+    if key:
+        callback_context.state[pending_key] = None
+    if key and llm_response.content and not llm_response.error_code:
+        try:
+            await asyncio.to_thread(llm_cache.put, key, llm_response)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store model response in cache: {e}")
+    return None
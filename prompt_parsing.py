@@ -0,0 +1,162 @@
+import json
+import logging
+import re
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z0-9_-]*\s*(.*?)```", re.DOTALL)
+
+
+def _prompts_from_value(value: Any) -> Optional[List[str]]:
+    """Extracts a clean prompt list from a decoded JSON value."""
+    if isinstance(value, dict):
+        value = value.get("image_prompts")
+    if not isinstance(value, list):
+        return None
+    prompts = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    return prompts or None
+
+
+def _try_json(text: str) -> Optional[List[str]]:
+    try:
+        return _prompts_from_value(json.loads(text))
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_image_prompts(raw: Any) -> Optional[List[str]]:
+    """
+    Parse the image prompt list produced by the ImagePromptGenerator agent.
+
+    Accepts the {"image_prompts": [...]} object described in
+    image_prompt_instruction.txt, either already decoded or as text. Text may be
+    wrapped in markdown code fences or surrounded by prose; the first parseable
+    JSON object or array is used.
+
+    Args:
+        raw: Value of state['image_prompts']
+
+    Returns:
+        List of prompts, or None if nothing usable could be parsed
+    """
+    if raw is None:
+        return None
+    if not isinstance(raw, str):
+        return _prompts_from_value(raw)
+
+    text = raw.strip()
+    candidates = [text]
+    candidates.extend(match.strip() for match in _CODE_FENCE.findall(text))
+
+    for candidate in candidates:
+        prompts = _try_json(candidate)
+        if prompts:
+            return prompts
+
+        # Fall back to the outermost object or array embedded in the text
+        for opening, closing in (("{", "}"), ("[", "]")):
+            start, end = candidate.find(opening), candidate.rfind(closing)
+            if 0 <= start < end:
+                prompts = _try_json(candidate[start:end + 1])
+                if prompts:
+                    return prompts
+
+    logger.info("Could not parse image prompts deterministically")
+    return None
+
+
+class IncrementalPromptParser:
+    """
+    Extracts image prompts from a JSON response while it is still being streamed.
+
+    Text chunks are fed in as they arrive. Every string in the "image_prompts"
+    array is returned as soon as its closing quote has been seen, so work on it
+    can start before the rest of the response exists.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = -1  # Scan offset inside the array; -1 until '[' is found
+        self._done = False
+        self.prompts: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Add a chunk of streamed text.
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            Prompts completed by this chunk, in order
+        """
+        self._buffer += chunk
+        if self._done:
+            return []
+
+        if self._position < 0:
+            key = self._buffer.find('"image_prompts"')
+            start = self._buffer.find("[", key) if key >= 0 else -1
+            if start < 0:
+                return []
+            self._position = start + 1
+
+        new_prompts = []
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if char in " \t\r\n,":
+                self._position += 1
+            elif char == "]":
+                self._done = True
+                break
+            elif char == '"':
+                end = self._find_string_end(self._position)
+                if end < 0:
+                    break  # The string is not complete yet
+                literal = self._buffer[self._position:end + 1]
+                self._position = end + 1
+                try:
+                    prompt = json.loads(literal).strip()
+                except ValueError:
+                    continue
+                if prompt:
+                    self.prompts.append(prompt)
+                    new_prompts.append(prompt)
+            else:
+                # Not a list of strings; leave it to finish()
+                self._done = True
+                break
+        return new_prompts
+
+    def _find_string_end(self, start: int) -> int:
+        """Returns the index of the closing quote of the string at start, or -1."""
+        index = start + 1
+        while index < len(self._buffer):
+            char = self._buffer[index]
+            if char == "\\":
+                index += 2
+                continue
+            if char == '"':
+                return index
+            index += 1
+        return -1
+
+    def finish(self, full_text: Any = None) -> List[str]:
+        """
+        Complete parsing once the response has ended.
+
+        Re-parses the full response (or the buffered text) with parse_image_prompts
+        and returns any prompts that were not already emitted by feed().
+
+        Args:
+            full_text: Final response value, if available
+
+        Returns:
+            Remaining prompts, in order
+        """
+        prompts = parse_image_prompts(full_text if full_text is not None else self._buffer) or []
+        remaining = prompts[len(self.prompts):]
+        self.prompts.extend(remaining)
+        self._done = True
+        return remaining
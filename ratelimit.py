@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call cannot complete before its deadline."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Extracts the HTTP status code from a genai APIError (or similar) exception."""
+    for attribute in ("code", "status_code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Reads the server-requested delay from a Retry-After header or a RetryInfo detail."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            pass
+
+    # Gemini API errors carry {"error": {"details": [{"retryDelay": "30s", ...}]}}
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = (details.get("error", details) or {}).get("details")
+    for detail in details if isinstance(details, list) else []:
+        delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for quota, transient server and timeout errors."""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # Timeouts, connection and protocol errors raised by genai's HTTP transport
+    import httpx
+
+    if isinstance(error, httpx.TransportError):
+        return True
+    status = _status_code(error)
+    return status in RETRYABLE_STATUS_CODES
+
+
+class AdaptiveLimiter:
+    """
+    Shared rate and concurrency controller for calls to a quota-limited API.
+
+    Requests are paced by a token bucket (rate per second with a burst allowance)
+    and admitted under an AIMD concurrency limit: every success raises the limit
+    by roughly one per window, every throttling response (429) halves it. Failed
+    calls are retried with full-jitter exponential backoff, honouring any delay
+    the server asks for, until the per-call deadline runs out.
+
+    The same instance can be used from threads (call) and coroutines (call_async).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate_per_second: float,
+        burst: int,
+        initial_concurrency: int,
+        max_concurrency: int,
+        max_retries: int = 5,
+        base_backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        deadline_seconds: float = 300.0,
+    ):
+        self.name = name
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.deadline_seconds = deadline_seconds
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._limit = float(min(initial_concurrency, max_concurrency))
+        self._in_flight = 0
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    # -- admission -----------------------------------------------------------
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate_per_second)
+        self._refilled_at = now
+
+    def _try_take_token(self) -> float:
+        """Takes a token if available. Returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_second
+
+    def _try_acquire(self) -> float:
+        """Takes a token and a concurrency slot. Returns 0, or the seconds to wait before retrying."""
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                return 0.05
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate_per_second
+            self._tokens -= 1
+            self._in_flight += 1
+            return 0.0
+
+    def _release(self, throttled: bool) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(1.0, self._limit / 2)
+                self._stats["throttled"] += 1
+                logger.warning(f"{self.name}: throttled, concurrency limit lowered to {int(self._limit)}")
+            else:
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+
+    def _check_deadline(self, deadline: float, wait: float) -> None:
+        if time.monotonic() + wait > deadline:
+            raise DeadlineExceeded(f"{self.name}: deadline exceeded")
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(self.max_backoff_seconds, retry_after)
+        return random.uniform(0, min(self.max_backoff_seconds, self.base_backoff_seconds * 2 ** attempt))
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        with self._lock:
+            if attempt >= self.max_retries or not is_retryable(error):
+                self._stats["failures"] += 1
+                return False
+            self._stats["retries"] += 1
+            return True
+
+    # -- public API ----------------------------------------------------------
+
+    def call(
+        self,
+        function: Callable[..., Any],
+        *args: Any,
+        deadline_seconds: Optional[float] = None,
+        on_retry: Optional[Callable[[Exception], None]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Call function under the limiter, retrying retryable failures.
+
+        Args:
+            function: Blocking callable to invoke
+            deadline_seconds: Overall time budget including retries (defaults to the limiter's)
+            on_retry: Called with the error before each retry
+
+        Returns:
+            The function's return value
+
+        Raises:
+            DeadlineExceeded: If the call could not complete within the deadline
+            Exception: The last error, if it was not retryable or retries ran out
+        """
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        while True:
+            wait = self._try_acquire()
+            while wait:
+                self._check_deadline(deadline, wait)
+                time.sleep(wait)
+                wait = self._try_acquire()
+
+            with self._lock:
+                self._stats["calls"] += 1
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self._release(throttled=_status_code(e) == 429)
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self._backoff(attempt, e)
+                self._check_deadline(deadline, delay)
+                logger.info(f"{self.name}: retrying in {delay:.1f}s after error: {e}")
+                if on_retry:
+                    on_retry(e)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._release(throttled=False)
+            return result
+
+    async def call_async(
+        self,
+        function: Callable[..., Any],
+        *args: Any,
+        deadline_seconds: Optional[float] = None,
+        on_retry: Optional[Callable[[Exception], None]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Async counterpart of call for coroutine functions."""
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        while True:
+            wait = self._try_acquire()
+            while wait:
+                self._check_deadline(deadline, wait)
+                await asyncio.sleep(wait)
+                wait = self._try_acquire()
+
+            with self._lock:
+                self._stats["calls"] += 1
+            try:
+                result = await asyncio.wait_for(function(*args, **kwargs), timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline:
+                    # Only wait_for running out of budget is final; a timeout
+                    # raised by the call itself is retried like any other error
+                    self._release(throttled=False)
+                    raise DeadlineExceeded(f"{self.name}: deadline exceeded") from e
+                self._release(throttled=_status_code(e) == 429)
+                if not self._should_retry(attempt, e):
+                    raise
+                delay = self._backoff(attempt, e)
+                self._check_deadline(deadline, delay)
+                logger.info(f"{self.name}: retrying in {delay:.1f}s after error: {e}")
+                if on_retry:
+                    on_retry(e)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._release(throttled=False)
+            return result
+
+    async def pace_async(self) -> None:
+        """Waits for a rate token without taking a concurrency slot (for calls made elsewhere)."""
+        wait = self._try_take_token()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._try_take_token()
+
+    def configure(self, rate_per_second: Optional[float] = None, burst: Optional[int] = None, concurrency: Optional[int] = None) -> None:
+        """Changes the pacing and concurrency settings at runtime and refills the bucket."""
+        with self._lock:
+            if rate_per_second is not None:
+                self.rate_per_second = rate_per_second
+            if burst is not None:
+                self.burst = burst
+            if concurrency is not None:
+                self.max_concurrency = concurrency
+                self._limit = float(concurrency)
+            self._tokens = float(self.burst)
+            self._refilled_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """Returns call counters and the current concurrency limit."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["concurrency_limit"] = int(self._limit)
+            stats["in_flight"] = self._in_flight
+        return stats
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, str(default)))
+
+
+# Shared limiter for every Imagen generate_images call
+imagen_limiter = AdaptiveLimiter(
+    name="imagen",
+    rate_per_second=_env_float("IMAGEN_RATE_PER_SECOND", 1.0),
+    burst=int(_env_float("IMAGEN_BURST", 4)),
+    initial_concurrency=int(_env_float("IMAGEN_INITIAL_CONCURRENCY", 4)),
+    max_concurrency=int(_env_float("IMAGEN_MAX_CONCURRENCY", 16)),
+    deadline_seconds=_env_float("IMAGEN_DEADLINE_SECONDS", 300.0),
+)
+
+# Shared pacing for Gemini calls made by the LLM agents
+gemini_limiter = AdaptiveLimiter(
+    name="gemini",
+    rate_per_second=_env_float("GEMINI_RATE_PER_SECOND", 10.0),
+    burst=int(_env_float("GEMINI_BURST", 20)),
+    initial_concurrency=int(_env_float("GEMINI_MAX_CONCURRENCY", 32)),
+    max_concurrency=int(_env_float("GEMINI_MAX_CONCURRENCY", 32)),
+)
+
+
+async def pace_model_call(callback_context: Any, llm_request: Any) -> None:
+    """before_model_callback that paces agent model calls through gemini_limiter."""
+    await gemini_limiter.pace_async()
+    return None
@@ -0,0 +1,301 @@
+"""
+HTTP front-end for the multi-agent content creator.
+
+Runs root_agent behind a small FastAPI app that streams progress as
+Server-Sent Events: every agent event, and every saved image (as soon as it is
+written with STREAM_IMAGES=true, otherwise when the image stage finishes).
+Admission control bounds the number of concurrently running sessions; requests
+beyond that wait in a short queue and are rejected with 503 once the queue is
+full or they have waited too long, so a load balancer can retry elsewhere.
+All requests share one Runner, session service and pooled Gemini client.
+
+Endpoints:
+    POST /run                               Run the workflow, streaming SSE events
+    GET  /sessions/{user_id}/{session_id}   Current session state
+    GET  /healthz                           Admission and client status
+    GET  /metrics                           Prometheus metrics (see tracing.py)
+
+Usage:
+    python -m simple_multi_agent.server --host 0.0.0.0 --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.types import Receive, Scope, Send
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+from google.genai import types
+from pydantic import BaseModel, Field
+
+from .agent import root_agent
+from .session_store import SqliteSessionService, create_session_service
+from .tracing import tracer
+from .util import aclose_clients, client_stats
+
+logger = logging.getLogger(__name__)
+
+APP_NAME = "simple_multi_agent"
+
+# State keys returned in the final "done" event
+RESULT_KEYS = ["final_content_summary", "generated_images", "generated_image_variants", "generated_image_derivatives"]
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted."""
+
+
+class AdmissionController:
+    """
+    Bounds concurrently running sessions, with a short bounded queue in front.
+
+    A request runs immediately while fewer than max_active sessions are running.
+    Otherwise it waits, up to queue_timeout_seconds, as long as fewer than
+    max_queued requests are already waiting; anything else is rejected at once.
+    """
+
+    def __init__(self, max_active: int, max_queued: int, queue_timeout_seconds: float):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_active)
+        self._active = 0
+        self._queued = 0
+        self._stats = {"admitted": 0, "rejected": 0, "timed_out": 0}
+
+    async def acquire(self) -> None:
+        """
+        Wait for a session slot.
+
+        Raises:
+            Overloaded: If the queue is full or the wait timed out
+        """
+        if self._semaphore.locked():
+            if self._queued >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise Overloaded("Too many requests queued")
+            self._queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                self._stats["timed_out"] += 1
+                raise Overloaded("Timed out waiting for a session slot")
+            finally:
+                self._queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self._active += 1
+        self._stats["admitted"] += 1
+
+    def release(self) -> None:
+        self._active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the running and queued counts and admission counters."""
+        return {"active": self._active, "queued": self._queued, "max_active": self.max_active, "max_queued": self.max_queued, **self._stats}
+
+
+class RunRequest(BaseModel):
+    """Request body for POST /run."""
+    user_id: str = Field(description="Id of the user the session belongs to")
+    message: str = Field(description="Topic or instruction for the content creator")
+    session_id: Optional[str] = Field(default=None, description="Existing session to continue (a new one is created when omitted or unknown)")
+    stream_tokens: bool = Field(default=False, description="Also stream partial model output as it is generated")
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _event_payload(event: Event) -> Dict[str, Any]:
+    """Summarizes an ADK event for clients."""
+    parts = event.content.parts if event.content and event.content.parts else []
+    state_delta = event.actions.state_delta if event.actions else {}
+    return {
+        "author": event.author,
+        "text": "".join(part.text or "" for part in parts),
+        "tool_calls": [call.name for call in event.get_function_calls()],
+        "partial": bool(event.partial),
+        "final": event.is_final_response(),
+        "state_keys": sorted(state_delta or {}),
+    }
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that gives back its admission slot however the response ends.
+
+    The body generator's own cleanup never runs if the client disconnects
+    before the body is iterated, and a BackgroundTask is skipped when sending
+    fails, so the slot is released once the response itself has finished.
+    """
+
+    def __init__(self, content: AsyncGenerator[str, None], release: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def _new_images(event: Event, sent: set) -> List[str]:
+    """Returns image paths first reported by this event."""
+    state_delta = (event.actions.state_delta if event.actions else None) or {}
+    paths = []
+    if isinstance(state_delta.get("last_generated_image"), str):
+        paths.append(state_delta["last_generated_image"])
+    if isinstance(state_delta.get("generated_images"), list):
+        paths.extend(path for path in state_delta["generated_images"] if isinstance(path, str))
+    new = [path for path in dict.fromkeys(paths) if path not in sent]
+    sent.update(new)
+    return new
+
+
+def create_app(
+    session_service: Optional[BaseSessionService] = None,
+    max_active: Optional[int] = None,
+    max_queued: Optional[int] = None,
+    queue_timeout_seconds: Optional[float] = None,
+) -> FastAPI:
+    """
+    Build the FastAPI app.
+
+    Args:
+        session_service: Session service shared by all requests (defaults to create_session_service())
+        max_active: Maximum concurrently running sessions (env SERVER_MAX_ACTIVE_SESSIONS, default 8)
+        max_queued: Maximum requests waiting for a slot (env SERVER_MAX_QUEUED, default 16)
+        queue_timeout_seconds: Maximum wait for a slot (env SERVER_QUEUE_TIMEOUT_SECONDS, default 5)
+
+    Returns:
+        The configured app
+    """
+    session_service = session_service or create_session_service()
+    runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service)
+    admission = AdmissionController(
+        max_active=max_active or int(os.environ.get("SERVER_MAX_ACTIVE_SESSIONS", "8")),
+        max_queued=max_queued if max_queued is not None else int(os.environ.get("SERVER_MAX_QUEUED", "16")),
+        queue_timeout_seconds=queue_timeout_seconds or float(os.environ.get("SERVER_QUEUE_TIMEOUT_SECONDS", "5")),
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+        yield
+        if isinstance(session_service, SqliteSessionService):
+            await session_service.close()
+        await aclose_clients()
+
+    app = FastAPI(title="Simple Multi-Agent Content Creator", lifespan=lifespan)
+    app.state.admission = admission
+    app.state.runner = runner
+
+    async def stream(request: RunRequest, session_id: str, release: Any) -> AsyncGenerator[str, None]:
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE if request.stream_tokens else StreamingMode.NONE)
+        content = types.Content(role="user", parts=[types.Part(text=request.message)])
+        sent_images: set = set()
+        try:
+            yield _sse("session", {"user_id": request.user_id, "session_id": session_id})
+            with tracer.scope():
+                async for event in runner.run_async(
+                    user_id=request.user_id, session_id=session_id, new_message=content, run_config=run_config
+                ):
+                    yield _sse("event", _event_payload(event))
+                    for path in _new_images(event, sent_images):
+                        yield _sse("image", {"path": path, "author": event.author})
+
+            session = await session_service.get_session(app_name=APP_NAME, user_id=request.user_id, session_id=session_id)
+            state = session.state if session else {}
+            yield _sse("done", {"session_id": session_id, **{key: state.get(key) for key in RESULT_KEYS}})
+        except Exception as e:
+            logger.error(f"Error running session {session_id}: {e}", exc_info=True)
+            yield _sse("error", {"session_id": session_id, "message": str(e)})
+        finally:
+            release()
+
+    @app.post("/run")
+    async def run(request: RunRequest) -> Any:
+        try:
+            await admission.acquire()
+        except Overloaded as e:
+            return JSONResponse(
+                status_code=503,
+                content={"error": str(e), **admission.stats()},
+                headers={"Retry-After": str(max(1, int(admission.queue_timeout_seconds)))},
+            )
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                admission.release()
+
+        try:
+            session = None
+            if request.session_id:
+                session = await session_service.get_session(
+                    app_name=APP_NAME, user_id=request.user_id, session_id=request.session_id
+                )
+            if session is None:
+                session = await session_service.create_session(
+                    app_name=APP_NAME, user_id=request.user_id, session_id=request.session_id
+                )
+        except Exception:
+            release()
+            raise
+
+        return _AdmittedStreamingResponse(
+            stream(request, session.id, release),
+            release,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/sessions/{user_id}/{session_id}")
+    async def get_session(user_id: str, session_id: str) -> Dict[str, Any]:
+        session = await session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return {"session_id": session.id, "user_id": session.user_id, "last_update_time": session.last_update_time, "state": session.state}
+
+    @app.get("/healthz")
+    async def healthz() -> Dict[str, Any]:
+        return {"status": "ok", "admission": admission.stats(), "clients": client_stats()}
+
+    @app.get("/metrics")
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(tracer.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the content creator over HTTP with SSE progress events")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+
+    import uvicorn
+
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
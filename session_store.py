@@ -0,0 +1,431 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[str, str, str]
+
+# State key prefixes shared across sessions rather than stored with each one
+SHARED_PREFIXES = (State.APP_PREFIX, State.USER_PREFIX)
+
+
+class SqliteSessionService(BaseSessionService):
+    """
+    Session service persisted to a local SQLite database.
+
+    Sessions and their events are stored in WAL mode and indexed by
+    (app_name, user_id, session_id), so they survive restarts. Only recently used
+    sessions are kept in memory: sessions idle for longer than idle_seconds, or
+    beyond max_cached_sessions, are dropped and loaded again lazily on access.
+    Appended events are buffered and written in batches, either when batch_size
+    events are pending or every flush_interval_seconds.
+
+    As in InMemorySessionService, state keys with the app: prefix are shared by
+    every session of the app, and keys with the user: prefix by every session of
+    the user; temp: keys are never persisted.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "output/sessions.sqlite3",
+        idle_seconds: float = 900.0,
+        max_cached_sessions: int = 1000,
+        batch_size: int = 50,
+        flush_interval_seconds: float = 1.0,
+    ):
+        self.db_path = db_path
+        self.idle_seconds = idle_seconds
+        self.max_cached_sessions = max_cached_sessions
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                last_update_time REAL NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS app_states (
+                app_name TEXT NOT NULL PRIMARY KEY,
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS user_states (
+                app_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id)
+            );
+            CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions (app_name, user_id, last_update_time);
+            """
+        )
+        self._connection.commit()
+
+        # Sessions held in memory, least recently used first, with their last access time.
+        # Their state holds only session-scoped keys; shared keys live in the maps below.
+        self._sessions: "OrderedDict[SessionKey, Tuple[Session, float]]" = OrderedDict()
+        self._app_states: Dict[str, Dict[str, Any]] = {}
+        self._user_states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Buffered writes: event rows, and sessions and shared states whose row must be rewritten
+        self._pending_events: List[Tuple[str, str, str, int, str]] = []
+        self._dirty: Dict[SessionKey, Session] = {}
+        self._dirty_apps: Set[str] = set()
+        self._dirty_users: Set[Tuple[str, str]] = set()
+        # Sequence number of the next event of each cached session
+        self._next_seq: Dict[SessionKey, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # -- storage -------------------------------------------------------------
+
+    @staticmethod
+    def _session_scoped(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in state.items() if not key.startswith(SHARED_PREFIXES + (State.TEMP_PREFIX,))}
+
+    def _write(
+        self,
+        events: List[Tuple[str, str, str, int, str]],
+        sessions: List[Session],
+        app_states: Optional[Dict[str, Dict[str, Any]]] = None,
+        user_states: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None,
+    ) -> None:
+        with self._db_lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO events (app_name, user_id, session_id, seq, event) VALUES (?, ?, ?, ?, ?)",
+                events,
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO sessions (app_name, user_id, session_id, state, last_update_time) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session.app_name, session.user_id, session.id, json.dumps(self._session_scoped(session.state), default=str), session.last_update_time)
+                    for session in sessions
+                ],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)",
+                [(app_name, json.dumps(state, default=str)) for app_name, state in (app_states or {}).items()],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                [(*key, json.dumps(state, default=str)) for key, state in (user_states or {}).items()],
+            )
+            self._connection.commit()
+
+    def _read_session(self, key: SessionKey) -> Optional[Tuple[Session, int]]:
+        """Returns the stored session and the sequence number of its next event."""
+        with self._db_lock:
+            row = self._connection.execute(
+                "SELECT state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            event_rows = self._connection.execute(
+                "SELECT seq, event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq", key
+            ).fetchall()
+        session = Session(
+            app_name=key[0],
+            user_id=key[1],
+            id=key[2],
+            state=json.loads(row[0]),
+            events=[Event.model_validate_json(event_row[1]) for event_row in event_rows],
+            last_update_time=row[1],
+        )
+        return session, event_rows[-1][0] + 1 if event_rows else 0
+
+    def _read_shared_states(self, app_name: str, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        with self._db_lock:
+            app_row = self._connection.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+            user_row = self._connection.execute(
+                "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchone()
+        return (json.loads(app_row[0]) if app_row else {}), (json.loads(user_row[0]) if user_row else {})
+
+    async def _shared_states(self, app_name: str, user_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Returns the (cached) app and user state shared by the sessions of app_name and user_id."""
+        if app_name not in self._app_states or (app_name, user_id) not in self._user_states:
+            app_state, user_state = await asyncio.to_thread(self._read_shared_states, app_name, user_id)
+            self._app_states.setdefault(app_name, app_state)
+            self._user_states.setdefault((app_name, user_id), user_state)
+        return self._app_states[app_name], self._user_states[(app_name, user_id)]
+
+    async def _update_shared_states(self, app_name: str, user_id: str, delta: Dict[str, Any]) -> None:
+        """Applies the app: and user: keys of a state delta to the shared states."""
+        if not any(key.startswith(SHARED_PREFIXES) for key in delta):
+            return
+        app_state, user_state = await self._shared_states(app_name, user_id)
+        for key, value in delta.items():
+            if key.startswith(State.APP_PREFIX):
+                app_state[key[len(State.APP_PREFIX):]] = value
+                self._dirty_apps.add(app_name)
+            elif key.startswith(State.USER_PREFIX):
+                user_state[key[len(State.USER_PREFIX):]] = value
+                self._dirty_users.add((app_name, user_id))
+
+    async def flush(self) -> None:
+        """Writes all buffered events and state changes to the database."""
+        events, self._pending_events = self._pending_events, []
+        dirty, self._dirty = self._dirty, {}
+        dirty_apps, self._dirty_apps = self._dirty_apps, set()
+        dirty_users, self._dirty_users = self._dirty_users, set()
+        if not events and not dirty and not dirty_apps and not dirty_users:
+            return
+        app_states = {app_name: dict(self._app_states[app_name]) for app_name in dirty_apps}
+        user_states = {key: dict(self._user_states[key]) for key in dirty_users}
+        try:
+            await asyncio.to_thread(self._write, events, list(dirty.values()), app_states, user_states)
+        except BaseException:
+            # Keep the batch for the next flush, ahead of anything buffered meanwhile
+            self._pending_events = events + self._pending_events
+            self._dirty = {**dirty, **self._dirty}
+            self._dirty_apps |= dirty_apps
+            self._dirty_users |= dirty_users
+            raise
+
+    async def _flush_periodically(self) -> None:
+        while self._pending_events or self._dirty or self._dirty_apps or self._dirty_users:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing session store: {e}", exc_info=True)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    # -- in-memory cache -----------------------------------------------------
+
+    def _remember(self, session: Session) -> None:
+        key = (session.app_name, session.user_id, session.id)
+        self._sessions[key] = (session, time.monotonic())
+        self._sessions.move_to_end(key)
+
+    async def _load(self, key: SessionKey) -> Optional[Session]:
+        """Returns the complete cached session, reading it from the database when not cached."""
+        if key not in self._sessions:
+            loaded = await asyncio.to_thread(self._read_session, key)
+            if loaded is None:
+                return None
+            # Another caller may have loaded the session while this one was reading
+            if key not in self._sessions:
+                self._sessions[key] = (loaded[0], time.monotonic())
+                self._next_seq[key] = loaded[1]
+        session = self._sessions[key][0]
+        self._remember(session)
+        return session
+
+    async def _evict_idle(self) -> None:
+        now = time.monotonic()
+        candidates = {
+            key: accessed_at for index, (key, (_, accessed_at)) in enumerate(self._sessions.items())
+            if now - accessed_at > self.idle_seconds or len(self._sessions) - index > self.max_cached_sessions
+        }
+        if not candidates:
+            return
+        # Evicted sessions are reloaded from the database, so it must be up to date
+        await self.flush()
+
+        # Sessions used or written to while flushing stay cached: their latest
+        # events may not be in the database yet
+        pending = {row[:3] for row in self._pending_events}
+        evicted = []
+        for key, accessed_at in candidates.items():
+            cached = self._sessions.get(key)
+            if cached is None or cached[1] != accessed_at or key in self._dirty or key in pending:
+                continue
+            self._sessions.pop(key)
+            self._next_seq.pop(key, None)
+            evicted.append(key)
+
+        # Drop shared states no cached session refers to
+        users = {key[:2] for key in self._sessions}
+        for user_key in [user_key for user_key in self._user_states if user_key not in users and user_key not in self._dirty_users]:
+            del self._user_states[user_key]
+        apps = {key[0] for key in self._sessions}
+        for app_name in [app_name for app_name in self._app_states if app_name not in apps and app_name not in self._dirty_apps]:
+            del self._app_states[app_name]
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} idle sessions from memory")
+
+    async def _merged_copy(self, session: Session, config: Optional[GetSessionConfig] = None) -> Session:
+        """Returns a copy of the session with the shared app: and user: state added and events filtered."""
+        copied = copy.deepcopy(session)
+        app_state, user_state = await self._shared_states(session.app_name, session.user_id)
+        copied.state.update({State.APP_PREFIX + key: copy.deepcopy(value) for key, value in app_state.items()})
+        copied.state.update({State.USER_PREFIX + key: copy.deepcopy(value) for key, value in user_state.items()})
+        if config:
+            if config.after_timestamp:
+                copied.events = [event for event in copied.events if event.timestamp >= config.after_timestamp]
+            if config.num_recent_events is not None:
+                copied.events = copied.events[-config.num_recent_events:] if config.num_recent_events else []
+        return copied
+
+    # -- BaseSessionService --------------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        key = (app_name, user_id, session_id)
+        if key in self._sessions or await asyncio.to_thread(self._read_session, key):
+            raise ValueError(f"Session {session_id} already exists")
+
+        await self._update_shared_states(app_name, user_id, state or {})
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=self._session_scoped(state or {}),
+            last_update_time=time.time(),
+        )
+        self._remember(session)
+        self._next_seq[key] = 0
+        self._dirty[key] = session
+        await self.flush()
+        await self._evict_idle()
+        return await self._merged_copy(session)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        session = await self._load((app_name, user_id, session_id))
+        if session is None:
+            return None
+        copied = await self._merged_copy(session, config)
+        await self._evict_idle()
+        return copied
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        await self.flush()
+
+        def query() -> List[Tuple[str, str, str, float]]:
+            with self._db_lock:
+                if user_id is None:
+                    return self._connection.execute(
+                        "SELECT user_id, session_id, state, last_update_time FROM sessions WHERE app_name = ? ORDER BY last_update_time",
+                        (app_name,),
+                    ).fetchall()
+                return self._connection.execute(
+                    "SELECT user_id, session_id, state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? ORDER BY last_update_time",
+                    (app_name, user_id),
+                ).fetchall()
+
+        rows = await asyncio.to_thread(query)
+        sessions = []
+        for row in rows:
+            session = Session(app_name=app_name, user_id=row[0], id=row[1], state=json.loads(row[2]), last_update_time=row[3])
+            sessions.append(await self._merged_copy(session))
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        key = (app_name, user_id, session_id)
+        self._sessions.pop(key, None)
+        self._dirty.pop(key, None)
+        self._next_seq.pop(key, None)
+        self._pending_events = [row for row in self._pending_events if row[:3] != key]
+
+        def delete() -> None:
+            with self._db_lock:
+                self._connection.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+                self._connection.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+                self._connection.commit()
+
+        await asyncio.to_thread(delete)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = await super().append_event(session, event)
+        session.last_update_time = event.timestamp
+
+        # The caller holds a copy from get_session, possibly with filtered events;
+        # apply the event to the complete cached session and the shared states
+        key = (session.app_name, session.user_id, session.id)
+        stored = await self._load(key)
+        if stored is None:
+            raise ValueError(f"Session {session.id} not found")
+        delta = (event.actions.state_delta if event.actions else None) or {}
+        await self._update_shared_states(session.app_name, session.user_id, delta)
+        if stored is not session:
+            stored.state.update(self._session_scoped(delta))
+            stored.events.append(event)
+            stored.last_update_time = event.timestamp
+
+        seq = self._next_seq[key]
+        self._next_seq[key] = seq + 1
+        self._pending_events.append((*key, seq, event.model_dump_json(exclude_none=True)))
+        self._dirty[key] = stored
+
+        if len(self._pending_events) >= self.batch_size:
+            await self.flush()
+        else:
+            self._schedule_flush()
+        return event
+
+    async def close(self) -> None:
+        """Flushes buffered writes and closes the database."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        with self._db_lock:
+            self._connection.close()
+
+
+def create_session_service() -> BaseSessionService:
+    """
+    Builds the session service selected by the environment.
+
+    Returns:
+        SqliteSessionService at SESSION_DB_PATH when it is set, otherwise InMemorySessionService
+    """
+    db_path = os.environ.get("SESSION_DB_PATH")
+    if not db_path:
+        return InMemorySessionService()
+    return SqliteSessionService(
+        db_path=db_path,
+        idle_seconds=float(os.environ.get("SESSION_IDLE_SECONDS", "900")),
+        max_cached_sessions=int(os.environ.get("SESSION_MAX_CACHED", "1000")),
+        batch_size=int(os.environ.get("SESSION_WRITE_BATCH_SIZE", "50")),
+        flush_interval_seconds=float(os.environ.get("SESSION_FLUSH_INTERVAL_SECONDS", "1.0")),
+    )
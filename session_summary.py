@@ -0,0 +1,148 @@
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .prompt_parsing import parse_image_prompts
+
+logger = logging.getLogger(__name__)
+
+# State keys holding the structured summary and its rendered, size-capped text
+SUMMARY_KEY = "session_summary"
+SUMMARY_TEXT_KEY = "session_summary_text"
+
+# Upper bound on the rendered summary, which agents read through {session_summary_text?}
+SUMMARY_MAX_CHARS = int(os.environ.get("SESSION_SUMMARY_MAX_CHARS", "600"))
+
+# Image paths kept in the summary; older ones are only counted
+RECENT_IMAGES = 3
+
+PREVIEW_CHARS = 100
+
+
+def update_summary(state: Any, **changes: Any) -> Dict[str, Any]:
+    """
+    Apply changes to the session summary held in state.
+
+    Only the fields given are touched, so each update costs the same however
+    large the session grows. Supported changes: script (str), image_prompts
+    (str or list), images (list of paths from one generation), last_image (path)
+    and final_content_summary (str).
+
+    Args:
+        state: Session state (read only; the caller applies the returned delta)
+        **changes: Values just written to state
+
+    Returns:
+        State delta with the new summary and its rendered text
+    """
+    summary = dict(state.get(SUMMARY_KEY) or {})
+
+    if isinstance(changes.get("script"), str):
+        script = changes["script"]
+        summary["script"] = {"chars": len(script), "preview": script[:PREVIEW_CHARS]}
+
+    if "image_prompts" in changes:
+        prompts = changes["image_prompts"]
+        parsed = prompts if isinstance(prompts, list) else parse_image_prompts(prompts)
+        summary["prompts"] = len(parsed or [])
+
+    if isinstance(changes.get("images"), list):
+        paths = [path for path in changes["images"] if isinstance(path, str)]
+        images = dict(summary.get("images") or {})
+        images["count"] = len(paths)
+        images["recent"] = paths[-RECENT_IMAGES:]
+        images["total_generated"] = images.get("total_generated", 0) + len(paths)
+        summary["images"] = images
+
+    if isinstance(changes.get("last_image"), str):
+        summary["last_image"] = changes["last_image"]
+
+    if isinstance(changes.get("final_content_summary"), str):
+        summary["final_summary_chars"] = len(changes["final_content_summary"])
+
+    summary["updated_at"] = time.time()
+    return {SUMMARY_KEY: summary, SUMMARY_TEXT_KEY: render_summary(summary)}
+
+
+def apply_summary(state: Any, **changes: Any) -> None:
+    """Updates the summary in a writable state (e.g. ToolContext.state)."""
+    for key, value in update_summary(state, **changes).items():
+        state[key] = value
+
+
+def render_summary(summary: Dict[str, Any], max_chars: Optional[int] = None) -> str:
+    """
+    Render the summary as compact text, cut to at most max_chars characters.
+
+    Args:
+        summary: Structured summary from update_summary
+        max_chars: Size cap (defaults to SUMMARY_MAX_CHARS)
+
+    Returns:
+        The rendered summary
+    """
+    max_chars = max_chars or SUMMARY_MAX_CHARS
+    lines: List[str] = []
+
+    script = summary.get("script")
+    if script:
+        ellipsis = "..." if script["chars"] > len(script["preview"]) else ""
+        lines.append(f"Script ({script['chars']} chars): {script['preview']}{ellipsis}")
+
+    if "prompts" in summary:
+        lines.append(f"Image Prompts: {summary['prompts']} prompts available")
+
+    images = summary.get("images")
+    if images:
+        lines.append(f"Generated Images: {images['count']} images ({images.get('total_generated', images['count'])} generated in this session)")
+        offset = images["count"] - len(images["recent"])
+        if offset:
+            lines.append(f"  ... {offset} earlier")
+        for i, path in enumerate(images["recent"], offset + 1):
+            lines.append(f"  {i}. {path}")
+
+    if summary.get("last_image"):
+        lines.append(f"Last Image: {summary['last_image']}")
+
+    if summary.get("final_summary_chars"):
+        lines.append(f"Final Summary: ready ({summary['final_summary_chars']} chars)")
+
+    text = "\n".join(lines) if lines else "No session data available"
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+
+def build_summary(state: Any) -> Dict[str, Any]:
+    """Builds a summary from scratch, for sessions created before summaries were maintained."""
+    changes = {change: state.get(key) for key, change in _OUTPUT_CHANGES.items() if state.get(key) is not None}
+    changes["last_image"] = state.get("last_generated_image")
+    return update_summary({}, **changes)[SUMMARY_KEY]
+
+
+# Change name for each state key written by an agent's output_key
+_OUTPUT_CHANGES = {
+    "generated_script": "script",
+    "image_prompts": "image_prompts",
+    "generated_images": "images",
+    "final_content_summary": "final_content_summary",
+}
+
+
+def summary_callback(output_key: str) -> Callable[[Any], None]:
+    """
+    Build an after_agent_callback that folds an agent's output into the session summary.
+
+    Args:
+        output_key: State key the agent produces
+
+    Returns:
+        Callback to pass as after_agent_callback
+    """
+    def after_agent(callback_context: Any) -> None:
+        state = callback_context.state
+        value = state.get(output_key)
+        if value is not None:
+            apply_summary(state, **{_OUTPUT_CHANGES[output_key]: value})
+        return None
+
+    return after_agent
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, Callable, List, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from .formatting import render_content_summary
+from .prompt_parsing import IncrementalPromptParser, parse_image_prompts
+from .tools import (
+    GenerateImageRequest,
+    GenerateMultipleImagesRequest,
+    render_image,
+    render_images,
+)
+from .session_summary import update_summary
+from .storage import output_store
+from .util import text2event
+
+logger = logging.getLogger(__name__)
+
+# State keys produced by the workflow, in pipeline order
+PIPELINE_KEYS = ["generated_script", "image_prompts", "generated_images", "final_content_summary"]
+
+# State key tracking which outputs are up to date for the current invocation
+PROGRESS_KEY = "workflow_progress"
+
+
+def is_valid_output(key: str, value: Any) -> bool:
+    """Checks whether a pipeline output holds usable content."""
+    if key == "generated_images":
+        return isinstance(value, list) and any(isinstance(path, str) and path for path in value)
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _fresh_keys(state: Any, invocation_id: str) -> List[str]:
+    """Returns the outputs produced during this invocation that are still up to date."""
+    progress = state.get(PROGRESS_KEY) or {}
+    if progress.get("invocation_id") != invocation_id:
+        return []
+    return list(progress.get("fresh", []))
+
+
+def reuse_output_callback(output_key: str) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """
+    Build a before_agent_callback that skips an agent whose output is already up to date.
+
+    On LoopAgent iterations after the first, a stage whose output was produced
+    earlier in the same invocation (and whose inputs have not been regenerated
+    since) is not run again.
+
+    Args:
+        output_key: State key the stage produces
+
+    Returns:
+        Callback to pass as before_agent_callback
+    """
+    def before_agent(callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        value = state.get(output_key)
+        if output_key in _fresh_keys(state, callback_context.invocation_id) and is_valid_output(output_key, value):
+            logger.info(f"{callback_context.agent_name}: reusing '{output_key}' from an earlier iteration")
+            # An LlmAgent saves this content to its output_key, so echo the
+            # stored text unchanged rather than a placeholder message.
+            text = value if isinstance(value, str) else f"Reusing '{output_key}' from an earlier iteration."
+            return types.Content(role="model", parts=[types.Part(text=text)])
+        return None
+
+    return before_agent
+
+
+def record_output_callback(output_key: str) -> Callable[[CallbackContext], Optional[types.Content]]:
+    """
+    Build an after_agent_callback that records whether a stage produced a valid output.
+
+    Regenerating a stage invalidates every stage downstream of it, so they are
+    re-run on the next iteration instead of being reused.
+
+    Args:
+        output_key: State key the stage produces
+
+    Returns:
+        Callback to pass as after_agent_callback
+    """
+    def after_agent(callback_context: CallbackContext) -> Optional[types.Content]:
+        state = callback_context.state
+        fresh = _fresh_keys(state, callback_context.invocation_id)
+        if output_key in PIPELINE_KEYS:
+            upstream = PIPELINE_KEYS[:PIPELINE_KEYS.index(output_key)]
+            fresh = [key for key in fresh if key in upstream]
+        if is_valid_output(output_key, state.get(output_key)):
+            fresh.append(output_key)
+        state[PROGRESS_KEY] = {"invocation_id": callback_context.invocation_id, "fresh": fresh}
+        return None
+
+    return after_agent
+
+
+class CompletionChecker(BaseAgent):
+    """
+    Ends the enclosing LoopAgent once all required outputs are valid.
+
+    Place it last in the loop's sub_agents. When every required key was produced
+    during the current invocation and holds valid content, it emits an escalation
+    event, which stops the loop without running further iterations.
+    """
+
+    required_keys: List[str] = ["final_content_summary", "generated_images"]
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        fresh = _fresh_keys(state, ctx.invocation_id)
+        missing = [
+            key for key in self.required_keys
+            if key not in fresh or not is_valid_output(key, state.get(key))
+        ]
+
+        if missing:
+            logger.info(f"Content not complete yet, missing: {', '.join(missing)}")
+            return
+
+        logger.info("All required content generated, ending the loop")
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            actions=EventActions(escalate=True),
+        )
+
+
+class ImageGenerationStage(BaseAgent):
+    """
+    Generates images straight from state['image_prompts'] without a model call.
+
+    The prompt list is parsed deterministically and handed to
+    generate_multiple_images. Only when parsing fails does the stage delegate to
+    the LLM-driven fallback agent, which must also be passed as its sub-agent.
+    """
+
+    fallback_agent: BaseAgent
+    aspect_ratio: str = "1:1"
+    output_prefix: str = "image"
+    variants: int = 1
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        prompts = parse_image_prompts(ctx.session.state.get("image_prompts"))
+
+        if not prompts:
+            logger.info(f"Falling back to {self.fallback_agent.name} for image generation")
+            async for event in self.fallback_agent.run_async(ctx):
+                yield event
+            return
+
+        request = GenerateMultipleImagesRequest(
+            prompts=prompts,
+            aspect_ratio=self.aspect_ratio,
+            output_prefix=self.output_prefix,
+            variants=self.variants
+        )
+        response = await render_images(request, output_store.run_dir(ctx.session.id, ctx.invocation_id))
+
+        if response.success:
+            report = f"Generated {len(response.image_paths)} images:\n" + "\n".join(f"- {path}" for path in response.image_paths)
+            state_delta = {
+                "generated_images": response.image_paths,
+                "generated_image_variants": response.variant_paths,
+                "generated_image_derivatives": response.derivative_paths,
+                "image_generation_report": report,
+            }
+            state_delta.update(update_summary(ctx.session.state, images=response.image_paths))
+        else:
+            report = f"Image generation failed: {response.error_message}"
+            state_delta = {"image_generation_report": report}
+
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=report)]),
+            actions=EventActions(state_delta=state_delta),
+        )
+
+
+class ContentFormatterStage(BaseAgent):
+    """
+    Renders state['final_content_summary'] locally from the script and image paths.
+
+    Replaces the LLM-based ContentFormatter, which only filled in a fixed
+    template. The template is any name registered in formatting.TEMPLATES.
+    """
+
+    template: str = "markdown"
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        script = state.get("generated_script") or ""
+        images = state.get("generated_images")
+        image_paths = images if isinstance(images, list) else []
+
+        summary = render_content_summary(script, image_paths, self.template)
+
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=summary)]),
+            actions=EventActions(state_delta={
+                "final_content_summary": summary,
+                **update_summary(state, final_content_summary=summary),
+            }),
+        )
+
+
+class StreamingImageStage(BaseAgent):
+    """
+    Runs the prompt agent and starts image generation while its prompts are still streaming.
+
+    Each prompt is dispatched to Imagen as soon as it is complete in the prompt
+    agent's partial output. Every finished image is reported as its own event
+    while the prompt agent and other images are still running. The prompt agent
+    must also be passed as the stage's sub-agent.
+
+    Partial output is only produced when the runner uses
+    RunConfig(streaming_mode=StreamingMode.SSE). Without it, all prompts are
+    dispatched together once the prompt agent's final response arrives.
+    """
+
+    prompt_agent: BaseAgent
+    aspect_ratio: str = "1:1"
+    output_prefix: str = "image"
+    max_concurrency: int = 4
+    variants: int = 1
+
+    def _image_event(self, ctx: InvocationContext, index: int, response: Any) -> Event:
+        event = text2event(self.name, self._describe(index, response))
+        event.invocation_id = ctx.invocation_id
+        event.branch = ctx.branch
+        if response is not None and response.success:
+            # Lets clients (e.g. the HTTP server) pick up each image as it finishes
+            event.actions.state_delta["last_generated_image"] = response.image_path
+            event.actions.state_delta.update(update_summary(ctx.session.state, last_image=response.image_path))
+        return event
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        parser = IncrementalPromptParser()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        completed: asyncio.Queue = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+        output_dir = output_store.run_dir(ctx.session.id, ctx.invocation_id)
+
+        async def render(index: int, prompt: str) -> None:
+            request = GenerateImageRequest(
+                prompt=prompt,
+                aspect_ratio=self.aspect_ratio,
+                output_filename=f"{self.output_prefix}_{index+1}.jpg",
+                number_of_variants=self.variants
+            )
+            try:
+                async with semaphore:
+                    response = await render_image(request, output_dir)
+            except Exception as e:
+                logger.error(f"Error generating image {index+1}: {e}")
+                response = None
+            await completed.put((index, response))
+
+        def dispatch(prompts: List[str]) -> None:
+            for prompt in prompts:
+                logger.info(f"Dispatching image {len(tasks)+1} while prompts are streaming")
+                tasks.append(asyncio.create_task(render(len(tasks), prompt)))
+
+        results = {}
+
+        def drain() -> List[Event]:
+            events = []
+            while not completed.empty():
+                index, response = completed.get_nowait()
+                results[index] = response
+                events.append(self._image_event(ctx, index, response))
+            return events
+
+        try:
+            async for event in self.prompt_agent.run_async(ctx):
+                if event.partial and event.content and event.content.parts:
+                    dispatch(parser.feed("".join(part.text or "" for part in event.content.parts)))
+                yield event
+                for image_event in drain():
+                    yield image_event
+
+            # Pick up anything the stream did not yield (non-streaming runs, reused prompts)
+            dispatch(parser.finish(ctx.session.state.get("image_prompts")))
+
+            while len(results) < len(tasks):
+                index, response = await completed.get()
+                results[index] = response
+                yield self._image_event(ctx, index, response)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        variant_paths = [
+            results[index].image_paths if results.get(index) is not None and results[index].success else []
+            for index in range(len(tasks))
+        ]
+        image_paths = [path for paths in variant_paths for path in paths]
+        derivative_paths = [
+            derivatives
+            for index in range(len(tasks)) if results.get(index) is not None and results[index].success
+            for derivatives in results[index].derivative_paths
+        ]
+        if image_paths:
+            report = f"Generated {len(image_paths)} images:\n" + "\n".join(f"- {path}" for path in image_paths)
+            state_delta = {
+                "generated_images": image_paths,
+                "generated_image_variants": variant_paths,
+                "generated_image_derivatives": derivative_paths,
+                "image_generation_report": report,
+            }
+            state_delta.update(update_summary(ctx.session.state, images=image_paths))
+        else:
+            report = "Image generation failed: no images were generated"
+            state_delta = {"image_generation_report": report}
+
+        yield Event(
+            author=self.name,
+            invocation_id=ctx.invocation_id,
+            branch=ctx.branch,
+            content=types.Content(role="model", parts=[types.Part(text=report)]),
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    @staticmethod
+    def _describe(index: int, response: Any) -> str:
+        if response is not None and response.success:
+            return f"Image {index+1} ready: {response.image_path}"
+        error = response.error_message if response is not None else "unexpected error"
+        return f"Image {index+1} failed: {error}"
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+# Directory name used when a session or run id is not known (e.g. direct tool calls)
+DEFAULT_SCOPE = "default"
+
+
+def _safe_name(value: Optional[str]) -> str:
+    """Turns a session or run id into a safe, bounded directory name."""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", value or "").strip("._")[:80]
+    return name or DEFAULT_SCOPE
+
+
+class OutputStore:
+    """
+    Session- and run-scoped storage for generated files.
+
+    Every run (one invocation of the workflow) writes into its own directory,
+    root_dir/<session id>/<run id>/, so identically named files from concurrent
+    sessions never overwrite each other. Each run directory holds a JSON-lines
+    manifest describing the files written to it.
+
+    Whole runs are evicted, oldest first, once they are older than
+    max_age_seconds or the store exceeds max_bytes. Runs modified within the
+    last EVICT_GRACE_SECONDS are never evicted, so a run still in progress is
+    left alone. Eviction runs on a background thread started on first use.
+    """
+
+    # Runs modified more recently than this are never evicted
+    EVICT_GRACE_SECONDS = 300.0
+
+    def __init__(self, root_dir: str, max_bytes: int, max_age_seconds: float, evict_interval_seconds: float = 300.0):
+        self.root_dir = Path(root_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.evict_interval_seconds = evict_interval_seconds
+        self._lock = threading.Lock()
+        self._evictor: Optional[threading.Thread] = None
+        self._stats = {"files_recorded": 0, "bytes_written": 0, "runs_evicted": 0, "bytes_evicted": 0}
+
+    def run_dir(self, session_id: Optional[str], run_id: Optional[str]) -> Path:
+        """
+        Return (and create) the output directory for a session's run.
+
+        Args:
+            session_id: ADK session id
+            run_id: Invocation id of the run
+
+        Returns:
+            Directory the run's files are written to
+        """
+        path = self.root_dir / _safe_name(session_id) / _safe_name(run_id)
+        path.mkdir(parents=True, exist_ok=True)
+        self._start_evictor()
+        return path
+
+    def record(self, run_dir: Path, paths: Iterable[str], **metadata: Any) -> None:
+        """
+        Add files written to run_dir to its manifest.
+
+        Args:
+            run_dir: Directory returned by run_dir()
+            paths: Paths of the files that were written
+            **metadata: Extra fields stored with each entry (e.g. prompt)
+        """
+        entries = []
+        for path in paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            entries.append({"path": str(path), "bytes": size, "created_at": time.time(), **metadata})
+        if not entries:
+            return
+
+        with self._lock:
+            with open(run_dir / MANIFEST_FILENAME, "a", encoding="utf-8") as file:
+                for entry in entries:
+                    file.write(json.dumps(entry, default=str) + "\n")
+            self._stats["files_recorded"] += len(entries)
+            self._stats["bytes_written"] += sum(entry["bytes"] for entry in entries)
+
+    def manifest(self, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Read the manifest entries of every run, or only of one session's runs.
+
+        Returns:
+            Manifest entries, oldest run first
+        """
+        pattern = f"{_safe_name(session_id)}/*/{MANIFEST_FILENAME}" if session_id else f"*/*/{MANIFEST_FILENAME}"
+        entries = []
+        for manifest_path in sorted(self.root_dir.glob(pattern), key=lambda path: path.stat().st_mtime):
+            session_name, run_name = manifest_path.parent.parent.name, manifest_path.parent.name
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        entries.append({"session": session_name, "run": run_name, **json.loads(line)})
+        return entries
+
+    def _runs(self) -> List[Tuple[float, int, Path]]:
+        """Returns (last modified, size in bytes, path) for every run directory."""
+        runs = []
+        for run_path in self.root_dir.glob("*/*"):
+            if not run_path.is_dir():
+                continue
+            size, modified = 0, run_path.stat().st_mtime
+            for file_path in run_path.rglob("*"):
+                try:
+                    stat = file_path.stat()
+                except FileNotFoundError:
+                    continue
+                if file_path.is_file():
+                    size += stat.st_size
+                modified = max(modified, stat.st_mtime)
+            runs.append((modified, size, run_path))
+        return runs
+
+    def disk_usage(self) -> Dict[str, Any]:
+        """Reports the bytes, files, runs and sessions held by the store, and the free space left on its disk."""
+        runs = self._runs()
+        files = sum(1 for _, _, run_path in runs for file_path in run_path.rglob("*") if file_path.is_file())
+        usage = {
+            "total_bytes": sum(size for _, size, _ in runs),
+            "max_bytes": self.max_bytes,
+            "files": files,
+            "runs": len(runs),
+            "sessions": len({run_path.parent for _, _, run_path in runs}),
+        }
+        if self.root_dir.exists():
+            usage["disk_free_bytes"] = shutil.disk_usage(self.root_dir).free
+        with self._lock:
+            usage.update(self._stats)
+        return usage
+
+    def evict(self) -> int:
+        """
+        Remove expired runs, then the oldest runs until the store is under max_bytes.
+
+        Returns:
+            Number of runs removed
+        """
+        if not self.root_dir.exists():
+            return 0
+
+        now = time.time()
+        runs = sorted(self._runs(), key=lambda run: run[0])
+        total = sum(size for _, size, _ in runs)
+        removed = 0
+        for modified, size, run_path in runs:
+            age = now - modified
+            if age < self.EVICT_GRACE_SECONDS:
+                continue
+            if age <= self.max_age_seconds and total <= self.max_bytes:
+                continue
+            shutil.rmtree(run_path, ignore_errors=True)
+            total -= size
+            removed += 1
+            with self._lock:
+                self._stats["runs_evicted"] += 1
+                self._stats["bytes_evicted"] += size
+            # Drop the session directory once its last run is gone
+            try:
+                run_path.parent.rmdir()
+            except OSError:
+                pass
+
+        if removed:
+            logger.info(f"Evicted {removed} output runs, {total} bytes remain in {self.root_dir}")
+        return removed
+
+    def _start_evictor(self) -> None:
+        if self._evictor is not None or self.evict_interval_seconds <= 0:
+            return
+        with self._lock:
+            if self._evictor is not None:
+                return
+
+            def run() -> None:
+                while True:
+                    try:
+                        self.evict()
+                    except Exception as e:
+                        logger.error(f"Error evicting output runs: {e}", exc_info=True)
+                    time.sleep(self.evict_interval_seconds)
+
+            self._evictor = threading.Thread(target=run, name="output-evictor", daemon=True)
+            self._evictor.start()
+
+
+# Shared store used by the image generation tools and stages
+output_store = OutputStore(
+    root_dir=os.environ.get("OUTPUT_DIR", "output/images"),
+    max_bytes=int(os.environ.get("OUTPUT_MAX_BYTES", str(10 * 1024 * 1024 * 1024))),
+    max_age_seconds=float(os.environ.get("OUTPUT_MAX_AGE_SECONDS", str(30 * 24 * 3600))),
+    evict_interval_seconds=float(os.environ.get("OUTPUT_EVICT_INTERVAL_SECONDS", "300")),
+)
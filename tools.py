@@ -1,36 +1,147 @@
+import asyncio
 import json
 import logging
+import uuid
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from google.adk.tools import FunctionTool, ToolContext
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, conint
 
-from .util import get_client, save_image_from_bytes
+from .cache import image_cache
+from .dedup import prompt_deduplicator
+from .derivatives import derivative_pipeline
+from .ratelimit import imagen_limiter
+from .session_summary import SUMMARY_KEY, SUMMARY_TEXT_KEY, apply_summary, build_summary, render_summary
+from .storage import output_store
+from .tracing import traced, tracer
+from .util import get_client, run_coroutine_sync, save_image_from_bytes_async
 
 logger = logging.getLogger(__name__)
 
+IMAGEN_MODEL = "models/imagen-3.0-generate-002"
+
+
+# Maximum number of images Imagen returns from a single generate_images call
+MAX_IMAGES_PER_CALL = 4
+
+
+def _variant_path(image_path: Path, index: int, count: int) -> Path:
+    """Returns the file path for variant index of count (the plain path when count is 1)."""
+    if count == 1:
+        return image_path
+    return image_path.with_name(f"{image_path.stem}_v{index+1}{image_path.suffix}")
+
+
+async def _render_variants(client, prompt: str, config: Dict[str, Any], image_paths: List[Path]) -> List[str]:
+    """
+    Render len(image_paths) variants of a prompt, serving each from the image cache when possible.
+    
+    Variants missing from the cache are requested together, packing up to
+    MAX_IMAGES_PER_CALL images into each generate_images call. The calls go
+    through the async client and files are written off the event loop.
+    
+    Args:
+        client: Gemini client used on a cache miss
+        prompt: The text prompt for image generation
+        config: Imagen generation config (number_of_images is set per call)
+        image_paths: Destination file for each variant
+        
+    Returns:
+        Paths of the variants that were written, in variant order
+    """
+    with tracer.span("imagen.generate_images", aspect_ratio=config.get("aspect_ratio"), variants=len(image_paths)) as span:
+        # Variant 0 keeps the single-image cache key so existing entries stay valid
+        cache_keys = [
+            image_cache.make_key(IMAGEN_MODEL, prompt, {**config, "number_of_images": 1, **({"variant": i} if i else {})})
+            for i in range(len(image_paths))
+        ]
+        written = {}
+        for i, (cache_key, image_path) in enumerate(zip(cache_keys, image_paths)):
+            if await asyncio.to_thread(image_cache.copy_to, cache_key, str(image_path)):
+                written[i] = str(image_path)
+        if written:
+            logger.info(f"Image cache hit for {len(written)}/{len(image_paths)} variants of '{prompt[:50]}...'")
+            span.add("cache_hit", len(written))
+        
+        missing = [i for i in range(len(image_paths)) if i not in written]
+        span.add("cache_miss", len(missing))
+        
+        async def render_batch(batch: List[int]) -> None:
+            # Generate image using Imagen, paced and retried by the shared limiter
+            result = await imagen_limiter.call_async(
+                client.aio.models.generate_images,
+                model=IMAGEN_MODEL,
+                prompt=prompt,
+                config={**config, "number_of_images": len(batch)},
+                on_retry=lambda error: span.add("retries")
+            )
+            span.add("api_calls")
+            
+            # Fewer images than requested can come back (e.g. safety filtering)
+            for i, generated in zip(batch, result.generated_images or []):
+                image_bytes = generated.image.image_bytes
+                span.add("image_bytes", len(image_bytes))
+                await save_image_from_bytes_async(image_bytes, str(image_paths[i]))
+                await asyncio.to_thread(image_cache.put, cache_keys[i], image_bytes)
+                written[i] = str(image_paths[i])
+        
+        await asyncio.gather(*(
+            render_batch(missing[start:start + MAX_IMAGES_PER_CALL])
+            for start in range(0, len(missing), MAX_IMAGES_PER_CALL)
+        ))
+        
+        return [written[i] for i in sorted(written)]
+
+
+async def _render_prompt(client, prompt: str, config: Dict[str, Any], image_paths: List[Path]) -> List[str]:
+    """Like _render_variants, but first tries to reuse the images of a near-identical recent prompt."""
+    # Images are only shared within one session: its runs all live under the same directory
+    session_dir = str(Path(image_paths[0]).parent.parent) if image_paths else ""
+    scope = (session_dir, config.get("aspect_ratio"), len(image_paths))
+    destinations = [str(path) for path in image_paths]
+    if await asyncio.to_thread(prompt_deduplicator.reuse, prompt, scope, destinations):
+        return destinations
+    
+    paths = await _render_variants(client, prompt, config, image_paths)
+    if len(paths) == len(image_paths):
+        prompt_deduplicator.remember(prompt, scope, paths)
+    return paths
+
 
 class GenerateImageRequest(BaseModel):
     """Request model for image generation."""
     prompt: str = Field(description="The text prompt for image generation")
     aspect_ratio: str = Field(default="1:1", description="Aspect ratio of the image (e.g., '1:1', '16:9')")
     output_filename: str = Field(description="Filename for the generated image")
+    number_of_variants: int = Field(default=1, ge=1, le=16, description="Number of variants to generate for the prompt")
 
 
 class GenerateImageResponse(BaseModel):
     """Response model for image generation."""
     success: bool = Field(description="Whether image generation was successful")
     image_path: str = Field(description="Path to the generated image file")
+    image_paths: List[str] = Field(default_factory=list, description="Paths to every generated variant")
+    derivative_paths: List[Dict[str, str]] = Field(default_factory=list, description="Derivative paths by derivative name, for each entry of image_paths")
     error_message: str = Field(default="", description="Error message if generation failed")
 
 
-def generate_image(request: GenerateImageRequest, tool_context: ToolContext) -> GenerateImageResponse:
+def _run_dir(tool_context: Optional[ToolContext]) -> Path:
+    """Returns the output directory for the session and invocation the tool runs in."""
+    if not tool_context:
+        # Direct calls have no session; a fresh run id keeps concurrent calls apart
+        return output_store.run_dir(None, uuid.uuid4().hex)
+    return output_store.run_dir(tool_context.session.id, tool_context.invocation_id)
+
+
+@traced("tool.generate_image")
+async def render_image(request: GenerateImageRequest, output_dir: Path, tool_context: Optional[ToolContext] = None) -> GenerateImageResponse:
     """
-    Generate an image using Imagen 3.0 based on a text prompt.
+    Generate an image into output_dir (used by generate_image_async and the pipeline stages).
     
     Args:
         request: GenerateImageRequest containing prompt and configuration
+        output_dir: Run directory from output_store.run_dir()
         tool_context: ADK ToolContext for session state access
         
     Returns:
@@ -50,39 +161,40 @@ def generate_image(request: GenerateImageRequest, tool_context: ToolContext) ->
             "person_generation": "ALLOW_ADULT"
         }
         
-        # Generate image using Imagen
-        result = client.models.generate_images(
-            model="models/imagen-3.0-generate-002",
-            prompt=request.prompt,
-            config=config
-        )
-        
-        if not result.generated_images:
+        # Generate (or fetch from cache) and save the image variants
+        base_path = output_dir / request.output_filename
+        variant_paths = [
+            _variant_path(base_path, i, request.number_of_variants)
+            for i in range(request.number_of_variants)
+        ]
+        image_paths = await _render_prompt(client, request.prompt, config, variant_paths)
+        if not image_paths:
             return GenerateImageResponse(
                 success=False,
                 image_path="",
                 error_message="No images were generated by the API"
             )
         
-        # Create output directory
-        output_dir = Path("output/images")
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Save the generated image
-        image_bytes = result.generated_images[0].image.image_bytes
-        image_path = output_dir / request.output_filename
-        save_image_from_bytes(image_bytes, str(image_path))
-        
+        image_path = image_paths[0]
         logger.info(f"Image successfully generated and saved to '{image_path}'")
+        await asyncio.to_thread(output_store.record, output_dir, image_paths, kind="image", prompt=request.prompt)
+        
+        # Thumbnails and re-encodes are rendered in the background at planned paths
+        derivative_paths = derivative_pipeline.submit(image_paths)
         
         # Store the image path in session state
         if tool_context:
-            tool_context.session_state["last_generated_image"] = str(image_path)
-            logger.info(f"Stored image path in session state: {str(image_path)}")
+            tool_context.state["last_generated_image"] = image_path
+            tool_context.state["last_generated_image_variants"] = image_paths
+            tool_context.state["last_generated_image_derivatives"] = derivative_paths
+            apply_summary(tool_context.state, last_image=image_path)
+            logger.info(f"Stored image path in session state: {image_path}")
         
         return GenerateImageResponse(
             success=True,
-            image_path=str(image_path),
+            image_path=image_path,
+            image_paths=image_paths,
+            derivative_paths=derivative_paths,
             error_message=""
         )
         
@@ -101,21 +213,32 @@ class GenerateMultipleImagesRequest(BaseModel):
     prompts: List[str] = Field(description="List of text prompts for image generation")
     aspect_ratio: str = Field(default="1:1", description="Aspect ratio for all images")
     output_prefix: str = Field(default="image", description="Prefix for output filenames")
+    max_concurrency: int = Field(default=4, ge=1, description="Maximum number of image generation calls in flight at once")
+    variants: int = Field(default=1, ge=1, le=16, description="Number of variants to generate for each prompt")
+    variants_per_prompt: Optional[List[conint(ge=1, le=16)]] = Field(default=None, description="Per-prompt variant counts, overriding 'variants' for the prompts they cover")
 
 
 class GenerateMultipleImagesResponse(BaseModel):
     """Response model for multiple image generation."""
     success: bool = Field(description="Whether all images were generated successfully")
     image_paths: List[str] = Field(description="Paths to the generated image files")
+    variant_paths: List[List[str]] = Field(default_factory=list, description="Generated image paths grouped by prompt")
+    derivative_paths: List[Dict[str, str]] = Field(default_factory=list, description="Derivative paths by derivative name, for each entry of image_paths")
     error_message: str = Field(default="", description="Error message if generation failed")
 
 
-def generate_multiple_images(request: GenerateMultipleImagesRequest, tool_context: ToolContext) -> GenerateMultipleImagesResponse:
+@traced("tool.generate_multiple_images")
+async def render_images(
+    request: GenerateMultipleImagesRequest,
+    output_dir: Path,
+    tool_context: Optional[ToolContext] = None,
+) -> GenerateMultipleImagesResponse:
     """
-    Generate multiple images using Imagen 3.0 based on a list of text prompts.
+    Generate images for several prompts into output_dir (used by generate_multiple_images_async and the pipeline stages).
     
     Args:
         request: GenerateMultipleImagesRequest containing prompts and configuration
+        output_dir: Run directory from output_store.run_dir()
         tool_context: ADK ToolContext for session state access
         
     Returns:
@@ -135,39 +258,46 @@ def generate_multiple_images(request: GenerateMultipleImagesRequest, tool_contex
             "person_generation": "ALLOW_ADULT"
         }
         
-        # Create output directory
-        output_dir = Path("output/images")
-        output_dir.mkdir(parents=True, exist_ok=True)
+        variant_counts = [
+            request.variants_per_prompt[i] if request.variants_per_prompt and i < len(request.variants_per_prompt) else request.variants
+            for i in range(len(request.prompts))
+        ]
         
-        image_paths = []
+        semaphore = asyncio.Semaphore(request.max_concurrency)
         
-        for i, prompt in enumerate(request.prompts):
+        async def render(i: int, prompt: str) -> List[str]:
             try:
                 logger.info(f"Generating image {i+1}/{len(request.prompts)}: '{prompt[:50]}...'")
                 
-                # Generate image using Imagen
-                result = client.models.generate_images(
-                    model="models/imagen-3.0-generate-002",
-                    prompt=prompt,
-                    config=config
-                )
-                
-                if not result.generated_images:
+                # Generate (or fetch from cache) and save the image variants
+                base_path = output_dir / f"{request.output_prefix}_{i+1}.jpg"
+                async with semaphore:
+                    paths = await _render_prompt(
+                        client, prompt, config,
+                        [_variant_path(base_path, j, variant_counts[i]) for j in range(variant_counts[i])]
+                    )
+                if not paths:
                     logger.warning(f"No image generated for prompt {i+1}")
-                    continue
-                
-                # Save the generated image
-                image_bytes = result.generated_images[0].image.image_bytes
-                filename = f"{request.output_prefix}_{i+1}.jpg"
-                image_path = output_dir / filename
-                save_image_from_bytes(image_bytes, str(image_path))
-                image_paths.append(str(image_path))
+                    return []
                 
-                logger.info(f"Image {i+1} saved to '{image_path}'")
+                logger.info(f"Image {i+1} saved to '{paths[0]}'" + (f" (+{len(paths) - 1} variants)" if len(paths) > 1 else ""))
+                await asyncio.to_thread(output_store.record, output_dir, paths, kind="image", prompt=prompt)
+                return paths
                 
             except Exception as e:
                 logger.error(f"Error generating image {i+1}: {str(e)}")
-                continue
+                return []
+        
+        # Near-identical prompts are rendered once and share the same images
+        canonical = prompt_deduplicator.collapse(request.prompts, scopes=variant_counts)
+        unique = [i for i, j in enumerate(canonical) if i == j]
+        
+        # The calls are independent, so run them concurrently under the semaphore.
+        # gather() returns results in submission order, keeping paths in prompt order.
+        rendered = dict(zip(unique, await asyncio.gather(*(render(i, request.prompts[i]) for i in unique))))
+        variant_paths = [rendered[canonical[i]] for i in range(len(request.prompts))]
+        
+        image_paths = [path for paths in variant_paths for path in paths]
         
         if not image_paths:
             return GenerateMultipleImagesResponse(
@@ -176,16 +306,26 @@ def generate_multiple_images(request: GenerateMultipleImagesRequest, tool_contex
                 error_message="No images were successfully generated"
             )
         
-        logger.info(f"Successfully generated {len(image_paths)} images")
+        logger.info(f"Successfully generated {len(image_paths)} images (image cache: {image_cache.stats()}, prompt dedup: {prompt_deduplicator.stats()}, limiter: {imagen_limiter.stats()})")
+        
+        # Thumbnails and re-encodes are rendered in the background at planned paths
+        unique_paths = list(dict.fromkeys(image_paths))
+        planned = dict(zip(unique_paths, derivative_pipeline.submit(unique_paths)))
+        derivative_paths = [planned[path] for path in image_paths]
         
         # Store the image paths in session state
         if tool_context:
-            tool_context.session_state["generated_images"] = image_paths
+            tool_context.state["generated_images"] = image_paths
+            tool_context.state["generated_image_variants"] = variant_paths
+            tool_context.state["generated_image_derivatives"] = derivative_paths
+            apply_summary(tool_context.state, images=image_paths)
             logger.info(f"Stored {len(image_paths)} image paths in session state")
         
         return GenerateMultipleImagesResponse(
             success=True,
             image_paths=image_paths,
+            variant_paths=variant_paths,
+            derivative_paths=derivative_paths,
             error_message=""
         )
         
@@ -199,55 +339,103 @@ def generate_multiple_images(request: GenerateMultipleImagesRequest, tool_contex
         )
 
 
-def get_session_info(tool_context: ToolContext) -> str:
+async def generate_image_async(request: GenerateImageRequest, tool_context: ToolContext) -> GenerateImageResponse:
     """
-    Get information about the current session state.
+    Generate an image using Imagen 3.0 based on a text prompt.
+    
+    The image is written to the output directory of the current session and run.
     
     Args:
+        request: GenerateImageRequest containing prompt and configuration
         tool_context: ADK ToolContext for session state access
         
     Returns:
-        String representation of session state
+        GenerateImageResponse with success status and image path
     """
-    if not tool_context:
-        return "No tool context available"
+    return await render_image(request, _run_dir(tool_context), tool_context)
+
+
+async def generate_multiple_images_async(request: GenerateMultipleImagesRequest, tool_context: ToolContext) -> GenerateMultipleImagesResponse:
+    """
+    Generate multiple images using Imagen 3.0 based on a list of text prompts.
     
-    session_state = tool_context.session_state
-    info = []
+    The images are written to the output directory of the current session and run.
+    
+    Args:
+        request: GenerateMultipleImagesRequest containing prompts and configuration
+        tool_context: ADK ToolContext for session state access
+        
+    Returns:
+        GenerateMultipleImagesResponse with success status and image paths
+    """
+    return await render_images(request, _run_dir(tool_context), tool_context)
+
+
+def generate_image(request: GenerateImageRequest, tool_context: ToolContext) -> GenerateImageResponse:
+    """
+    Synchronous wrapper around generate_image_async for callers without an event loop.
     
-    if "generated_script" in session_state:
-        info.append(f"Script: {session_state['generated_script'][:100]}...")
+    Args:
+        request: GenerateImageRequest containing prompt and configuration
+        tool_context: ADK ToolContext for session state access
+        
+    Returns:
+        GenerateImageResponse with success status and image path
+    """
+    return run_coroutine_sync(generate_image_async(request, tool_context))
+
+
+def generate_multiple_images(request: GenerateMultipleImagesRequest, tool_context: ToolContext) -> GenerateMultipleImagesResponse:
+    """
+    Synchronous wrapper around generate_multiple_images_async for callers without an event loop.
     
-    if "image_prompts" in session_state:
-        prompts = session_state["image_prompts"]
-        if isinstance(prompts, str):
-            info.append(f"Image Prompts: {prompts[:100]}...")
-        else:
-            info.append(f"Image Prompts: {len(prompts)} prompts available")
+    Args:
+        request: GenerateMultipleImagesRequest containing prompts and configuration
+        tool_context: ADK ToolContext for session state access
+        
+    Returns:
+        GenerateMultipleImagesResponse with success status and image paths
+    """
+    return run_coroutine_sync(generate_multiple_images_async(request, tool_context))
+
+
+@traced("tool.session_info")
+def get_session_info(tool_context: ToolContext, max_chars: Optional[int] = None) -> str:
+    """
+    Get information about the current session state.
     
-    if "generated_images" in session_state:
-        images = session_state["generated_images"]
-        info.append(f"Generated Images: {len(images)} images")
-        for i, img_path in enumerate(images[:3], 1):
-            info.append(f"  {i}. {img_path}")
-        if len(images) > 3:
-            info.append(f"  ... and {len(images) - 3} more")
+    Reads the session summary the tools and stages keep up to date, so the cost
+    does not grow with the session. Sessions without a summary get one built
+    from their state.
     
-    if "last_generated_image" in session_state:
-        info.append(f"Last Image: {session_state['last_generated_image']}")
+    Args:
+        tool_context: ADK ToolContext for session state access
+        max_chars: Optional size cap for the returned text (defaults to SESSION_SUMMARY_MAX_CHARS)
+        
+    Returns:
+        String representation of session state
+    """
+    if not tool_context:
+        return "No tool context available"
     
-    return "\n".join(info) if info else "No session data available"
+    session_state = tool_context.state
+    summary = session_state.get(SUMMARY_KEY)
+    if summary is None:
+        return render_summary(build_summary(session_state), max_chars)
+    if max_chars is None and session_state.get(SUMMARY_TEXT_KEY):
+        return session_state[SUMMARY_TEXT_KEY]
+    return render_summary(summary, max_chars)
 
 
-# Create function tools
+# Create function tools (async, so image generation never blocks the runner's event loop)
 generate_image_tool = FunctionTool(
     description="Generate a single image using Imagen 3.0 based on a text prompt",
-    function=generate_image
+    function=generate_image_async
 )
 
 generate_multiple_images_tool = FunctionTool(
     description="Generate multiple images using Imagen 3.0 based on a list of text prompts",
-    function=generate_multiple_images
+    function=generate_multiple_images_async
 )
 
 session_info_tool = FunctionTool(
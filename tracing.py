@@ -0,0 +1,342 @@
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class _NoopSpan:
+    """Span returned while tracing is disabled; every operation is a no-op."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: float = 1) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# Keys of the keyed spans started inside the current Tracer.scope(), if any
+_scope_keys: contextvars.ContextVar[Optional[List[Tuple[str, ...]]]] = contextvars.ContextVar("trace_scope_keys", default=None)
+
+
+class Span:
+    """A timed operation with attributes, recorded by its Tracer when it ends."""
+
+    __slots__ = ("tracer", "name", "attributes", "start", "error")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def end(self) -> None:
+        self.tracer._record(self, time.perf_counter() - self.start)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc is not None:
+            self.error = str(exc)
+        self.end()
+
+
+class Tracer:
+    """
+    Collects spans for agent turns, model calls, tool invocations and Imagen calls.
+
+    Finished spans are aggregated into per-span-name latency histograms and
+    attribute totals (tokens, image bytes, cache hits, retries, ...) served in
+    Prometheus text format, and optionally appended to a JSON-lines trace file
+    by a background thread, so recording a span never does file I/O on the
+    event loop. While disabled, span() returns a shared no-op span, so instrumentation costs
+    a single attribute check.
+    """
+
+    def __init__(self, enabled: bool = False, trace_file: Optional[str] = None):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._open_spans: Dict[Tuple[str, ...], Span] = {}
+        self._server: Optional[Any] = None
+        self._trace_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def span(self, name: str, **attributes: Any) -> Any:
+        """Starts a span; use it as a context manager or call end() on it."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def start_keyed(self, key: Tuple[str, ...], name: str, **attributes: Any) -> None:
+        """Starts a span that is ended later, from another callback, with end_keyed()."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._open_spans[key] = Span(self, name, attributes)
+        keys = _scope_keys.get()
+        if keys is not None:
+            keys.append(key)
+
+    def end_keyed(self, key: Tuple[str, ...], error: Optional[str] = None, **attributes: Any) -> None:
+        """Ends a span started with start_keyed(), adding the given attributes (and error, if it failed)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            span = self._open_spans.pop(key, None)
+        if span is not None:
+            span.attributes.update(attributes)
+            span.error = error or span.error
+            span.end()
+
+    @contextlib.contextmanager
+    def scope(self) -> Iterator[None]:
+        """
+        Scope for one agent run: keyed spans it leaves open are ended when it exits.
+
+        An agent or model call that raises skips its after_* callback, so its
+        span would otherwise stay in _open_spans forever. Such spans are
+        recorded as failed with the run's error.
+        """
+        if not self.enabled:
+            yield
+            return
+        keys: List[Tuple[str, ...]] = []
+        token = _scope_keys.set(keys)
+        error = "not ended"
+        try:
+            yield
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            for key in keys:
+                self.end_keyed(key, error=error)
+            try:
+                _scope_keys.reset(token)
+            except ValueError:
+                # Exited from another context (e.g. an async generator closed elsewhere)
+                pass
+
+    def _record(self, span: Span, duration: float) -> None:
+        with self._lock:
+            metric = self._metrics.setdefault(
+                span.name,
+                {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(DURATION_BUCKETS), "totals": {}},
+            )
+            metric["count"] += 1
+            metric["sum"] += duration
+            metric["errors"] += 1 if span.error else 0
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metric["buckets"][index] += 1
+                    break
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric["totals"][key] = metric["totals"].get(key, 0) + value
+                elif isinstance(value, bool) and value:
+                    metric["totals"][key] = metric["totals"].get(key, 0) + 1
+
+            if self.trace_file:
+                record = {
+                    "name": span.name,
+                    "timestamp": time.time() - duration,
+                    "duration_seconds": round(duration, 6),
+                    "attributes": dict(span.attributes),
+                }
+                if span.error:
+                    record["error"] = span.error
+                self._trace_queue.put(record)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_trace_file, name="trace-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_trace_file(self) -> None:
+        """Appends queued span records to the trace file, batching whatever has accumulated."""
+        while True:
+            records = [self._trace_queue.get()]
+            while not self._trace_queue.empty():
+                records.append(self._trace_queue.get_nowait())
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as file:
+                    file.writelines(json.dumps(record, default=str) + "\n" for record in records)
+            except OSError as e:
+                logger.warning(f"Could not write trace file: {e}")
+            finally:
+                for _ in records:
+                    self._trace_queue.task_done()
+
+    def flush(self) -> None:
+        """Blocks until every recorded span has been written to the trace file."""
+        if self._writer is not None:
+            self._trace_queue.join()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Returns a copy of the aggregated metrics, keyed by span name."""
+        with self._lock:
+            return json.loads(json.dumps(self._metrics))
+
+    def render_prometheus(self) -> str:
+        """Renders the aggregated metrics in Prometheus text exposition format."""
+        lines = [
+            "# TYPE simple_multi_agent_span_duration_seconds histogram",
+        ]
+        totals_lines = []
+        error_lines = []
+        for name, metric in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, metric["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'simple_multi_agent_span_duration_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'simple_multi_agent_span_duration_seconds_sum{{span="{name}"}} {metric["sum"]:.6f}')
+            lines.append(f'simple_multi_agent_span_duration_seconds_count{{span="{name}"}} {metric["count"]}')
+            error_lines.append(f'simple_multi_agent_span_errors_total{{span="{name}"}} {metric["errors"]}')
+            for key, value in sorted(metric["totals"].items()):
+                totals_lines.append(f'simple_multi_agent_span_attribute_total{{span="{name}",attribute="{key}"}} {value}')
+
+        lines.append("# TYPE simple_multi_agent_span_errors_total counter")
+        lines.extend(error_lines)
+        lines.append("# TYPE simple_multi_agent_span_attribute_total counter")
+        lines.extend(totals_lines)
+        return "\n".join(lines) + "\n"
+
+    def start_metrics_server(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serves render_prometheus() at http://host:port/metrics from a daemon thread."""
+        if self._server is not None:
+            return
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = tracer.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+
+
+tracer = Tracer(
+    enabled=os.environ.get("TRACING_ENABLED", "false").lower() in ("1", "true", "yes"),
+    trace_file=os.environ.get("TRACE_FILE") or None,
+)
+
+atexit.register(tracer.flush)
+
+if tracer.enabled and os.environ.get("METRICS_PORT"):
+    tracer.start_metrics_server(int(os.environ["METRICS_PORT"]))
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator recording each call of a tool function (sync or async) as a span named name."""
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not tracer.enabled:
+                    return await function(*args, **kwargs)
+                with tracer.span(name) as span:
+                    result = await function(*args, **kwargs)
+                    if getattr(result, "success", None) is False:
+                        span.error = getattr(result, "error_message", "") or "failed"
+                    return result
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name) as span:
+                result = function(*args, **kwargs)
+                if getattr(result, "success", None) is False:
+                    span.error = getattr(result, "error_message", "") or "failed"
+                return result
+        return wrapper
+    return decorator
+
+
+# -- ADK callbacks -------------------------------------------------------------
+
+def trace_agent_start(callback_context: Any) -> None:
+    """before_agent_callback that opens a span for the agent turn."""
+    if tracer.enabled:
+        key = ("agent", callback_context.invocation_id, callback_context.agent_name)
+        tracer.start_keyed(key, f"agent.{callback_context.agent_name}", invocation_id=callback_context.invocation_id)
+    return None
+
+
+def trace_agent_end(callback_context: Any) -> None:
+    """after_agent_callback that closes the agent turn span."""
+    if tracer.enabled:
+        tracer.end_keyed(("agent", callback_context.invocation_id, callback_context.agent_name))
+    return None
+
+
+def trace_model_start(callback_context: Any, llm_request: Any) -> None:
+    """before_model_callback that opens a span for the model call."""
+    if tracer.enabled:
+        key = ("model", callback_context.invocation_id, callback_context.agent_name)
+        tracer.start_keyed(key, f"model.{callback_context.agent_name}", model=getattr(llm_request, "model", None))
+    return None
+
+
+def trace_model_error(callback_context: Any, llm_request: Any, error: Exception) -> None:
+    """on_model_error_callback that closes the model call span as failed (the error is still raised)."""
+    if tracer.enabled:
+        tracer.end_keyed(("model", callback_context.invocation_id, callback_context.agent_name), error=str(error) or type(error).__name__)
+    return None
+
+
+def trace_model_end(callback_context: Any, llm_response: Any) -> None:
+    """after_model_callback that closes the model call span with its token counts."""
+    if not tracer.enabled or getattr(llm_response, "partial", False):
+        return None
+    usage = getattr(llm_response, "usage_metadata", None)
+    tracer.end_keyed(
+        ("model", callback_context.invocation_id, callback_context.agent_name),
+        prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+        output_tokens=getattr(usage, "candidates_token_count", None) or 0,
+    )
+    return None
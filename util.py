@@ -1,15 +1,22 @@
 import os
+import asyncio
+import atexit
+import hashlib
 import logging
+import threading
+import time
+import uuid
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Coroutine, Dict, List, Optional, Tuple
 
-from PIL import Image
-from google import genai
-from google.adk.events import Event
-from google.genai import types
+# PIL, the genai client and ADK events are imported on first use to keep
+# importing the package cheap
+if TYPE_CHECKING:
+    from google import genai
+    from google.adk.agents.readonly_context import ReadonlyContext
+    from google.adk.events import Event
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -21,35 +28,315 @@ def load_instruction_from_file(filename: str, default_instruction: str = "Defaul
         filepath = os.path.join(os.path.dirname(__file__), filename)
         with open(filepath, 'r', encoding="utf-8") as file:
             instruction = file.read()
-        print(f"Successfully loaded instruction from {filename}.")
+        logger.info(f"Successfully loaded instruction from {filename}.")
         
     except FileNotFoundError:
-        print(f"WARNING: Instruction file not found {filename}. Using default instruction.")
+        logger.warning(f"Instruction file not found {filename}. Using default instruction.")
     except Exception as e:
-        print(f"ERROR: {e} loading {filename}. Using default instruction.")
+        logger.error(f"{e} loading {filename}. Using default instruction.")
     
     return instruction
 
 
-def get_client(api_key: Optional[str] = None) -> genai.Client:
-    """Initializes and returns a Gemini client."""
+class InstructionFile:
+    """
+    Agent instruction provider backed by an instruction file.
+    
+    The file is read on first use rather than at import time. Its text is cached
+    and read again only when the file's modification time changes, so edits take
+    effect without restarting the process. Session state placeholders such as
+    {generated_script} are filled in as they are for plain string instructions.
+    """
+    
+    def __init__(self, filename: str, default_instruction: str = "Default instruction."):
+        self.filename = filename
+        self.default_instruction = default_instruction
+        self._path = os.path.join(os.path.dirname(__file__), filename)
+        self._lock = threading.Lock()
+        self._mtime: Optional[int] = None
+        self._text: Optional[str] = None
+    
+    def text(self) -> str:
+        """Returns the instruction text, reloading it if the file has changed."""
+        try:
+            mtime = os.stat(self._path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if self._text is None or mtime != self._mtime:
+                self._text = load_instruction_from_file(self.filename, self.default_instruction)
+                self._mtime = mtime
+            return self._text
+    
+    async def __call__(self, readonly_context: "ReadonlyContext") -> str:
+        from google.adk.utils.instructions_utils import inject_session_state
+        
+        return await inject_session_state(self.text(), readonly_context)
+
+
+# Process-wide client registry, keyed by a fingerprint of the API key and the
+# event loop the client is used from. A genai.Client owns its HTTP connection
+# pools, so sharing one keeps connections alive across tool calls and sessions
+# instead of paying for client construction and a cold TLS handshake on every
+# call. Its async (client.aio) transport is bound to the first loop that uses
+# it, so every running loop gets a client of its own; synchronous callers share
+# the client registered for no loop.
+_client_lock = threading.Lock()
+_clients: Dict[Tuple[str, Optional[asyncio.AbstractEventLoop]], Dict[str, Any]] = {}
+# Clients registered with register_client, used from every loop
+_registered: Dict[str, Dict[str, Any]] = {}
+
+
+def _key_fingerprint(api_key: str) -> str:
+    """Returns a short, non-reversible identifier for an API key."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _release_clients(entries: List[Dict[str, Any]]) -> None:
+    """Closes clients and drops the last references to them, outside any event loop."""
+    while entries:
+        entry = entries.pop()
+        try:
+            entry["client"].close()
+        except Exception as e:
+            logger.warning(f"Error closing Gemini client: {e}")
+
+
+def _drop_closed_loops() -> None:
+    """Forgets clients whose event loop has been closed (caller holds _client_lock).
+
+    Their async transports cannot be closed any more, and a genai client being
+    garbage collected on a running loop would try to, so they are released on a
+    short-lived thread without a loop.
+    """
+    closed = [_clients.pop(key) for key in [key for key in _clients if key[1] is not None and key[1].is_closed()]]
+    if closed:
+        threading.Thread(target=_release_clients, args=(closed,), name="client-release", daemon=True).start()
+
+
+def get_client(api_key: Optional[str] = None) -> "genai.Client":
+    """Returns the shared Gemini client for the given (or environment) API key.
+
+    Clients are created on first use and reused afterwards, one per event loop
+    (plus one for callers outside any loop), because the async transport of a
+    client only works on the loop it was first used on. Clients of loops that
+    have since closed are dropped. The registry is guarded by a lock, so it is
+    safe to call from worker threads and from coroutines on any event loop.
+    """
+    if not api_key:
+        api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable not set.")
+    
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    
+    fingerprint = _key_fingerprint(api_key)
+    with _client_lock:
+        entry = _registered.get(fingerprint)
+        if entry is None:
+            _drop_closed_loops()
+            entry = _clients.get((fingerprint, loop))
+        if entry is None:
+            from google import genai
+            
+            logger.info(f"Creating shared Gemini client for key {fingerprint}" + (" on a new event loop" if loop else ""))
+            entry = {"client": genai.Client(api_key=api_key), "created_at": time.time(), "uses": 0}
+            _clients[(fingerprint, loop)] = entry
+        entry["uses"] += 1
+        entry["last_used_at"] = time.time()
+        return entry["client"]
+
+
+def register_client(client: Any, api_key: Optional[str] = None) -> None:
+    """Registers a preconfigured client (e.g. with custom HTTP options or a local stand-in) for an API key.
+
+    The client is returned to callers on every event loop, so it must not bind
+    its transport to a single loop.
+    """
     if not api_key:
         api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("GOOGLE_API_KEY environment variable not set.")
-    return genai.Client(api_key=api_key)
+    with _client_lock:
+        now = time.time()
+        _registered[_key_fingerprint(api_key)] = {"client": client, "created_at": now, "last_used_at": now, "uses": 0}
+
+
+def client_stats() -> Dict[str, Dict[str, Any]]:
+    """Reports the age, idle time and use count of the pooled clients, keyed by API key fingerprint.
 
+    Clients created for different event loops are summed per key. This does not
+    probe the connections; a failing transport shows up as failed calls.
+    """
+    now = time.time()
+    with _client_lock:
+        _drop_closed_loops()
+        entries = [(key[0], entry) for key, entry in _clients.items()] + list(_registered.items())
+        stats: Dict[str, Dict[str, Any]] = {}
+        for fingerprint, entry in entries:
+            item = stats.setdefault(fingerprint, {"clients": 0, "uses": 0, "age_seconds": 0.0, "idle_seconds": None})
+            item["clients"] += 1
+            item["uses"] += entry["uses"]
+            item["age_seconds"] = max(item["age_seconds"], round(now - entry["created_at"], 3))
+            idle = round(now - entry["last_used_at"], 3)
+            item["idle_seconds"] = idle if item["idle_seconds"] is None else min(item["idle_seconds"], idle)
+        return stats
 
-def text2event(author: str, text_message: str) -> Event:
+
+def close_clients() -> None:
+    """Closes every shared client and empties the registry.
+
+    Called automatically at interpreter exit; call it explicitly when rotating
+    API keys or shutting a server down.
+    """
+    with _client_lock:
+        entries = list(_clients.values()) + list(_registered.values())
+        _clients.clear()
+        _registered.clear()
+    for entry in entries:
+        try:
+            entry["client"].close()
+        except Exception as e:
+            logger.warning(f"Error closing Gemini client: {e}")
+
+
+async def aclose_clients() -> None:
+    """Async counterpart of close_clients that also closes the async transports bound to the running loop."""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        entries = [(key[1], entry) for key, entry in _clients.items()] + [(loop, entry) for entry in _registered.values()]
+        _clients.clear()
+        _registered.clear()
+    for client_loop, entry in entries:
+        try:
+            if client_loop is loop:
+                await entry["client"].aio.aclose()
+            entry["client"].close()
+        except Exception as e:
+            logger.warning(f"Error closing Gemini client: {e}")
+
+
+atexit.register(close_clients)
+
+
+# Event loop shared by every synchronous caller of run_coroutine_sync, so the
+# sync wrappers reuse one pooled client (see get_client) instead of creating a
+# client and connections for a new loop on every call.
+_sync_loop: Optional[asyncio.AbstractEventLoop] = None
+_sync_loop_lock = threading.Lock()
+
+
+def _get_sync_loop() -> asyncio.AbstractEventLoop:
+    """Returns the background event loop, starting its thread on first use."""
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="sync-tool-loop", daemon=True).start()
+            _sync_loop = loop
+        return _sync_loop
+
+
+def run_coroutine_sync(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Runs a coroutine to completion from synchronous code.
+    
+    The coroutine runs on one long-lived background event loop, so async
+    clients reused across calls keep working. Works whether or not the calling
+    thread is running an event loop of its own.
+    
+    Args:
+        coroutine: The coroutine to run
+        
+    Returns:
+        The coroutine's result
+    """
+    loop = _get_sync_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("run_coroutine_sync cannot be called from the background loop itself; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+def text2event(author: str, text_message: str) -> "Event":
     """Creates an ADK Event with a simple text message."""
+    from google.adk.events import Event
+    from google.genai import types
+    
     return Event(
         author=author,
         content=types.Content(parts=[types.Part(text=text_message)]),
     )
 
 
-def save_image_from_bytes(image_bytes: bytes, output_filepath: str) -> None:
-    """Saves image bytes to a file using Pillow."""
-    image = Image.open(BytesIO(image_bytes))
-    image.save(output_filepath)
-    logger.info(f"Image successfully saved to '{output_filepath}'") 
\ No newline at end of file
+def write_bytes_atomic(data: bytes, output_filepath: str) -> None:
+    """Writes bytes to a temporary file next to output_filepath, then renames it into place."""
+    directory = os.path.dirname(os.path.abspath(output_filepath))
+    tmp_path = os.path.join(directory, f".tmp-{uuid.uuid4().hex}-{os.path.basename(output_filepath)}")
+    # Created like a plain open() would (0o666 less the umask, applied by the OS);
+    # O_EXCL keeps the unique name from ever being shared
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, output_filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_image_from_bytes(
+    image_bytes: bytes,
+    output_filepath: str,
+    validate: bool = False,
+    output_format: Optional[str] = None,
+) -> None:
+    """
+    Saves image bytes to a file.
+    
+    The encoded bytes returned by the API are written directly and atomically, so
+    readers never observe a partially written file. Pillow only decodes the image
+    when validate is set or an output_format different from the source is requested.
+    
+    Args:
+        image_bytes: Encoded image bytes (e.g. JPEG from Imagen)
+        output_filepath: Destination path
+        validate: Decode the image to make sure the bytes are a readable image
+        output_format: Pillow format name (e.g. "PNG", "WEBP") to convert to before saving
+    """
+    if validate or output_format:
+        from PIL import Image
+        
+        image = Image.open(BytesIO(image_bytes))
+        image.load()
+        
+        target_format = (output_format or "").upper().replace("JPG", "JPEG")
+        if target_format and target_format != image.format:
+            if target_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = BytesIO()
+            image.save(buffer, format=target_format)
+            image_bytes = buffer.getvalue()
+    
+    write_bytes_atomic(image_bytes, output_filepath)
+    logger.info(f"Image successfully saved to '{output_filepath}'")
+
+
+async def save_image_from_bytes_async(
+    image_bytes: bytes,
+    output_filepath: str,
+    validate: bool = False,
+    output_format: Optional[str] = None,
+) -> None:
+    """Runs save_image_from_bytes in a worker thread so the event loop is never blocked."""
+    await asyncio.to_thread(save_image_from_bytes, image_bytes, output_filepath, validate, output_format)